@@ -1,8 +1,7 @@
 from os.path import join
+from functools import partial
 import pandas as pd
 import xarray as xr
-from netCDF4 import Dataset
-from scipy.io import loadmat
 
 from ninolearn.pathes import rawdir
 
@@ -11,6 +10,66 @@ This module collects a bunch methods to read the raw data files.
 """
 
 
+def _select(ds, startdate=None, enddate=None, lon_min=None, lon_max=None,
+            lat_min=None, lat_max=None, time='time'):
+    """
+    Select a time period and a region from a data set. This is used as
+    preprocess function of xarray.open_mfdataset such that the selection is
+    done for each file before the data is concatenated and loaded.
+
+    :param startdate, enddate: The first and the last month (e.g. '1980-01')\
+    of the selected period.
+
+    :param lon_min,lon_max: The minimum and the maximum longitude of the\
+    region (from 0 to 360 degrees east).
+
+    :param lat_min,lat_max: The minimum and the maximum latitude of the\
+    region (from -90 to 90 degrees north).
+
+    :param time: The name of the time dimension.
+    """
+    if startdate is not None or enddate is not None:
+        ds = ds.sel({time: slice(startdate, enddate)})
+
+    if lon_min is None and lon_max is None and lat_min is None and lat_max is None:
+        return ds
+
+    lat = next((name for name in ['lat', 'latitude', 'nav_lat'] if name in ds.coords), None)
+    lon = next((name for name in ['lon', 'longitude', 'nav_lon'] if name in ds.coords), None)
+    if lat is None or lon is None:
+        return ds
+
+    if ds[lat].ndim == 1:
+        if ds[lat].values[0] > ds[lat].values[-1]:
+            lat_slice = slice(lat_max, lat_min)
+        else:
+            lat_slice = slice(lat_min, lat_max)
+        return ds.sel({lat: lat_slice, lon: slice(lon_min, lon_max)})
+
+    # curvilinear grid
+    mask = True
+    if lat_min is not None:
+        mask = mask & (ds[lat] > lat_min)
+    if lat_max is not None:
+        mask = mask & (ds[lat] < lat_max)
+    if lon_min is not None:
+        mask = mask & (ds[lon] > lon_min)
+    if lon_max is not None:
+        mask = mask & (ds[lon] < lon_max)
+    return ds.where(mask, drop=True)
+
+
+def _month_start(time):
+    """
+    Assign the time steps (datetime or cftime objects) of monthly data to the
+    first day of the respective month.
+    """
+    if time.dtype.kind == 'M':
+        time = pd.to_datetime(time)
+    return pd.to_datetime([f'{t.year:04d}-{t.month:02d}-01' for t in time])
+
+
+
 def nino34_anom():
     """
     Get the Nino3.4 Index anomaly.
@@ -75,11 +134,13 @@ def dmi():
     """
     get DMI data
     """
+    from netCDF4 import Dataset
     data = Dataset(join(rawdir, 'dmi.nc'))
     return data
 
 
 def K_index():
+    from scipy.io import loadmat
     data = loadmat(join(rawdir, "Kindex.mat"))
 
     kindex = data['Kindex2_mon_anom'][:,0]
@@ -165,49 +226,76 @@ def olr():
     return data.olr
 
 
-def ssh():
+def ssh(startdate=None, enddate=None, lon_min=None, lon_max=None,
+        lat_min=None, lat_max=None):
     """
-    Get sea surface height. And change some attirbutes and coordinate names
+    Get sea surface height. And change some attirbutes and coordinate names.
+    The time period and the region are selected for each file before the
+    files are combined.
     """
+    select = partial(_select, startdate=startdate, enddate=enddate,
+                     lon_min=lon_min, lon_max=lon_max,
+                     lat_min=lat_min, lat_max=lat_max, time='time_counter')
     data = xr.open_mfdataset(join(rawdir, 'ssh', '*.nc'),
-                             concat_dim='time_counter')
+                             concat_dim='time_counter', preprocess=select)
     data_return = data.sossheig.rename({'time_counter': 'time'})
-    maxtime = pd.to_datetime(data_return.time.values.max()).date()
-    data_return['time'] = pd.date_range(start='1979-01-01',
-                                        end=maxtime,
-                                        freq='MS')
+    data_return['time'] = _month_start(data_return.time.values)
     data_return.attrs['dataset'] = 'ORAP5'
     data_return.name = 'ssh'
     return data_return
 
-def godas(variable="sshg"):
-    ds = xr.open_mfdataset(join(rawdir, f'{variable}_godas', '*.nc'),
-                             concat_dim='time')
+def godas(variable="sshg", startdate=None, enddate=None, lon_min=None,
+          lon_max=None, lat_min=None, lat_max=None):
+    """
+    Get GODAS data. The time period, the region and (for 3D variables) the
+    level are selected for each file before the data is loaded.
+    """
+    def select(ds):
+        if len(ds[variable].shape)==4:
+            ds = ds.loc[dict(level=5)]
+        return _select(ds, startdate=startdate, enddate=enddate,
+                       lon_min=lon_min, lon_max=lon_max,
+                       lat_min=lat_min, lat_max=lat_max)
 
-    if len(ds[variable].shape)==4:
-        data = ds.loc[dict(level=5)].load()
-    else:
-        data = ds.load()
+    ds = xr.open_mfdataset(join(rawdir, f'{variable}_godas', '*.nc'),
+                             concat_dim='time', preprocess=select)
+    data = ds.load()
 
     data[variable].attrs['dataset'] = 'GODAS'
     return data[variable]
 
-def oras4():
+def oras4(startdate=None, enddate=None, lon_min=None, lon_max=None,
+          lat_min=None, lat_max=None):
+    """
+    Get ORAS4 sea surface height. The time period and the region are selected
+    for each file before the data is loaded.
+    """
+    select = partial(_select, startdate=startdate, enddate=enddate,
+                     lon_min=lon_min, lon_max=lon_max,
+                     lat_min=lat_min, lat_max=lat_max)
     ds = xr.open_mfdataset(join(rawdir, f'ssh_oras4', '*.nc'),
-                             concat_dim='time')
+                             concat_dim='time', preprocess=select)
     data = ds.load()
     data.zos.attrs['dataset'] = 'ORAS4'
     return data.zos
 
-def sat_gfdl():
+def sat_gfdl(startdate=None, enddate=None, lon_min=None, lon_max=None,
+             lat_min=None, lat_max=None):
+    """
+    Get the GFDL-CM3 surface air temperature. The time period and the region
+    are selected for each file before the data is loaded.
+    """
+    select = partial(_select, startdate=startdate, enddate=enddate,
+                     lon_min=lon_min, lon_max=lon_max,
+                     lat_min=lat_min, lat_max=lat_max)
     data = xr.open_mfdataset(join(rawdir, 'sat_gfdl', '*.nc'),
-                             concat_dim='time')
+                             concat_dim='time', preprocess=select)
 
     data = data.load()
     data.tas.attrs['dataset'] = 'GFDL-CM3'
 
     # this change needs to be done to prevent OutOfBoundsError
-    data['time'] = pd.date_range(start='1700-01-01', end='2199-12-01',freq='MS')
+    data['time'] = _month_start(data.time.values)
     return data.tas
 
 def ssh_gfdl():
@@ -231,17 +319,27 @@ def sst_gfdl():
     data['time'] = pd.date_range(start='1700-01-01', end='2199-12-01',freq='MS')
     return data.tos
 
-def hca_mon():
+def hca_mon(startdate=None, enddate=None, lon_min=None, lon_max=None,
+            lat_min=None, lat_max=None):
     """
     heat content anomaly, seasonal variable to the first day of the middle season
-    and upsample the data
+    and upsample the data. The time period and the region are selected before
+    the data is upsampled.
     """
     data = xr.open_dataset(join(rawdir, "hca.nc"), decode_times=False)
     data['time'] = pd.date_range(start='1955-02-01', end='2019-02-01', freq='3MS')
     data.h18_hc.attrs['dataset'] = 'NODC'
 
+    # keep the neighbouring seasons for the interpolation at the boundaries
+    start = None if startdate is None else pd.to_datetime(startdate) - pd.DateOffset(months=3)
+    end = None if enddate is None else pd.to_datetime(enddate) + pd.DateOffset(months=3)
+    data = _select(data, startdate=start, enddate=end,
+                   lon_min=lon_min, lon_max=lon_max,
+                   lat_min=lat_min, lat_max=lat_max)
+
     data_raw = data.h18_hc[:,0,:,:]
     data_upsampled = data_raw.resample(time='MS').interpolate('linear')
+    data_upsampled = data_upsampled.sel(time=slice(startdate, enddate))
     data_upsampled.name = 'hca'
     return data_upsampled
 
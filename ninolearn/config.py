@@ -0,0 +1,246 @@
+"""
+This module contains the threading configuration of the training.
+
+By default, TensorFlow, the BLAS library and OpenMP each start one thread per
+core. When several trainings run at once on a shared node (e.g. the workers of
+a parallel hyperparameter search or several scripts), the node is
+oversubscribed. The settings are read from the environment variables
+
+    NINOLEARN_THREADS           threads per process (TF intra-op, BLAS, OpenMP)
+    NINOLEARN_INTER_OP_THREADS  TF inter-op threads per process
+    NINOLEARN_CORES             core set of the process, e.g. '0-7' or '0-3,8-11'
+
+or they are set with set_threads(). The settings are applied by apply() before
+the training. The workers of a parallel hyperparameter search split the core
+set among themselves and are pinned to their share. If no number of threads is
+given, a worker uses one thread per core of its share.
+
+The settings must be applied before TensorFlow is initialized, otherwise they
+do not apply to it. The workers of a parallel search are spawned with the
+thread environment variables already set (see worker_environment()), because
+a spawned worker imports the main script (and with it possibly TensorFlow)
+before it runs any ninolearn code. The settings that are in effect after the
+training (see effective()) are saved together with the models.
+"""
+import os
+import sys
+import warnings
+from contextlib import contextmanager
+
+settings = {'threads': None, 'inter_op_threads': None, 'cores': None}
+
+# environment variables that limit the threads of the numerical libraries
+_thread_variables = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                     'TF_NUM_INTRAOP_THREADS']
+
+
+def parse_cores(cores):
+    """
+    Returns the sorted list of the cores in a core set like '0-3,8,10-11'.
+    """
+    if cores is None or cores == '':
+        return None
+    if not isinstance(cores, str):
+        return sorted(set(int(core) for core in cores))
+
+    result = set()
+    for part in cores.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            result.update(range(int(first), int(last) + 1))
+        else:
+            result.add(int(part))
+    return sorted(result)
+
+
+def _int_variable(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def set_threads(threads=None, inter_op_threads=None, cores=None):
+    """
+    Set and apply the threading configuration of this process.
+
+    :type threads: int
+    :param threads: The number of threads of TF (intra-op), BLAS and OpenMP.
+
+    :type inter_op_threads: int
+    :param inter_op_threads: The number of TF inter-op threads.
+
+    :param cores: The core set to which the process is pinned, either a\
+    string like '0-3,8' or a list of cores.
+    """
+    settings['threads'] = threads
+    settings['inter_op_threads'] = inter_op_threads
+    settings['cores'] = parse_cores(cores)
+    apply()
+
+
+def available_cores():
+    """
+    The configured core set or, if none is configured, the cores that the
+    process may run on.
+    """
+    if settings['cores'] is not None:
+        return settings['cores']
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+def worker_cores(worker, n_workers):
+    """
+    The share of the available cores of one of n_workers workers.
+    """
+    cores = available_cores()
+    if n_workers > len(cores):
+        return [cores[worker % len(cores)]]
+    share = len(cores) // n_workers
+    return cores[worker * share:(worker + 1) * share]
+
+
+@contextmanager
+def worker_environment(n_workers):
+    """
+    A context in which the thread environment variables are set for the
+    workers of a parallel search (threads per worker as in apply()). Worker
+    processes that are started in this context inherit them.
+
+    :type n_workers: int
+    :param n_workers: The number of parallel workers.
+    """
+    threads = settings['threads']
+    if threads is None:
+        threads = len(worker_cores(0, n_workers))
+
+    variables = {name: str(threads) for name in _thread_variables}
+    if settings['inter_op_threads'] is not None:
+        variables['TF_NUM_INTEROP_THREADS'] = str(settings['inter_op_threads'])
+
+    previous = {name: os.environ.get(name) for name in variables}
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+
+
+def apply(worker=None, n_workers=1):
+    """
+    Apply the threading configuration to this process. The number of
+    threads is passed to the numerical libraries via their environment
+    variables (which take effect when they are loaded) and, if they are
+    already loaded, to TensorFlow and the BLAS/OpenMP thread pools.
+
+    :type worker: int
+    :param worker: The index of the worker in a pool of n_workers parallel\
+    workers. The worker is pinned to its share of the core set. This share\
+    (and the number of threads) becomes the setting of the process, hence\
+    later calls of apply() keep it.
+
+    :type n_workers: int
+    :param n_workers: The number of parallel workers.
+    """
+    if worker is not None:
+        settings['cores'] = worker_cores(worker, n_workers)
+        if settings['threads'] is None:
+            settings['threads'] = len(settings['cores'])
+
+    threads = settings['threads']
+    cores = settings['cores']
+
+    if cores is not None:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cores)
+        else:
+            warnings.warn("Pinning processes to cores is not supported on this platform.")
+
+    if threads is not None:
+        for name in _thread_variables:
+            os.environ[name] = str(threads)
+    if settings['inter_op_threads'] is not None:
+        os.environ['TF_NUM_INTEROP_THREADS'] = str(settings['inter_op_threads'])
+
+    if threads is not None and 'numpy' in sys.modules:
+        try:
+            from threadpoolctl import threadpool_limits
+        except ImportError:
+            pass
+        else:
+            threadpool_limits(threads)
+
+    if 'tensorflow' in sys.modules:
+        _apply_tensorflow(threads, settings['inter_op_threads'])
+
+
+def _apply_tensorflow(threads, inter_op_threads):
+    """
+    Set the threads of an already loaded TensorFlow. They can not be changed
+    anymore once TensorFlow has been initialized.
+    """
+    import tensorflow as tf
+
+    try:
+        if threads is not None:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+        if inter_op_threads is not None:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError:
+        warnings.warn("TensorFlow is already initialized. The threading configuration does not apply to it.")
+
+
+def effective():
+    """
+    Returns the threading settings that are in effect in this process: the
+    cores it may run on, the threads of the BLAS/OpenMP thread pools (if
+    threadpoolctl is installed) and the threads of TensorFlow (if it is
+    loaded). For TensorFlow, the thread counts it actually uses are recorded
+    (see _tf_threads()).
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = available_cores()
+
+    result = {'cores': cores}
+
+    if 'numpy' in sys.modules:
+        try:
+            from threadpoolctl import threadpool_info
+        except ImportError:
+            pass
+        else:
+            result['thread_pools'] = {pool['internal_api']: pool['num_threads']
+                                      for pool in threadpool_info()}
+
+    if 'tensorflow' in sys.modules:
+        import tensorflow as tf
+        intra_op = tf.config.threading.get_intra_op_parallelism_threads()
+        inter_op = tf.config.threading.get_inter_op_parallelism_threads()
+        result['tensorflow'] = {
+            'intra_op_threads': _tf_threads(intra_op, 'TF_NUM_INTRAOP_THREADS', cores),
+            'inter_op_threads': _tf_threads(inter_op, 'TF_NUM_INTEROP_THREADS', cores)}
+    return result
+
+
+def _tf_threads(configured, variable, cores):
+    """
+    The number of threads TensorFlow uses. A setting of 0 means that it
+    takes the number from the environment variable or, if not set, uses one
+    thread per available core.
+    """
+    if configured > 0:
+        return configured
+    if os.environ.get(variable):
+        return int(os.environ[variable])
+    return len(cores)
+
+
+settings.update(threads=_int_variable('NINOLEARN_THREADS'),
+                inter_op_threads=_int_variable('NINOLEARN_INTER_OP_THREADS'),
+                cores=parse_cores(os.environ.get('NINOLEARN_CORES')))
@@ -0,0 +1,131 @@
+"""
+Benchmark of the import time of the ninolearn modules.
+
+Each module is imported in a fresh interpreter. Besides the import time, the
+heavy backends that were loaded by the import are recorded. Modules must not
+load the backends that are listed for them in *light_modules*. These
+backends are only imported on first use.
+
+Furthermore, the lazily imported names in *lazy_classes* must be classes,
+also after the submodule of the same name was imported.
+
+Run the benchmark with::
+
+    python -m ninolearn.importtime
+"""
+import json
+import subprocess
+import sys
+
+heavy_backends = ['tensorflow', 'keras', 'matplotlib', 'igraph', 'iris',
+                  'xarray', 'netCDF4', 'sklearn', 'scipy']
+
+# the modules and the heavy backends they must not load
+light_modules = {
+    'ninolearn.utils': ['tensorflow', 'keras', 'matplotlib', 'scipy'],
+    'ninolearn.config': ['tensorflow', 'keras', 'matplotlib', 'scipy'],
+    'ninolearn.IO.read_raw': ['tensorflow', 'keras', 'matplotlib', 'netCDF4'],
+    'ninolearn.preprocess.regrid': ['tensorflow', 'keras', 'matplotlib', 'iris'],
+    'ninolearn.preprocess.pca': ['tensorflow', 'keras', 'matplotlib', 'igraph'],
+    'ninolearn.learn.models': ['tensorflow', 'keras'],
+    'ninolearn.learn.models.baseModel': ['tensorflow', 'keras'],
+    'ninolearn.learn.inference': ['tensorflow', 'keras', 'xarray', 'sklearn'],
+    'ninolearn.learn.distill': ['tensorflow', 'keras', 'xarray', 'sklearn'],
+    'ninolearn.learn.fit': ['tensorflow', 'keras', 'matplotlib', 'xarray'],
+    }
+
+# lazily imported classes that have the names of their submodules
+lazy_classes = {'ninolearn.learn.models': ['baseModel', 'ipnn']}
+
+_code = ("import json, sys, time\n"
+         "start = time.perf_counter()\n"
+         "import {module}\n"
+         "passed = time.perf_counter() - start\n"
+         "loaded = [m for m in {backends!r} if m in sys.modules]\n"
+         "print(json.dumps([passed, loaded]))")
+
+
+def import_time(module):
+    """
+    Import a module in a fresh interpreter.
+
+    :returns: The import time in seconds and the list of the heavy backends\
+    that were loaded.
+    """
+    code = _code.format(module=module, backends=heavy_backends)
+    result = subprocess.run([sys.executable, '-c', code],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode != 0:
+        raise ImportError(f"Importing {module} failed:\n{result.stderr}")
+
+    passed, loaded = json.loads(result.stdout.splitlines()[-1])
+    return passed, loaded
+
+
+_class_code = ("import json\n"
+               "try:\n"
+               "    import {package}.{name}\n"
+               "    from {package} import {name}\n"
+               "    print(json.dumps(isinstance({name}, type)))\n"
+               "except ModuleNotFoundError as e:\n"
+               "    if e.name.startswith('ninolearn'):\n"
+               "        raise\n"
+               "    print(json.dumps(None))")
+
+
+def is_class(package, name):
+    """
+    Check in a fresh interpreter that the name of the package is a class
+    after its submodule of the same name was imported.
+
+    :returns: True or False, or None if a dependency of the submodule is\
+    not installed.
+    """
+    code = _class_code.format(package=package, name=name)
+    result = subprocess.run([sys.executable, '-c', code],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode != 0:
+        raise ImportError(f"Importing {package}.{name} failed:\n{result.stderr}")
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def benchmark(modules=None):
+    """
+    Measure the import time of the modules and check that they do not load
+    forbidden heavy backends.
+
+    :param modules: A dictionary with the modules and the backends they must\
+    not load. Default is light_modules.
+
+    :returns: A list of the modules that loaded a forbidden backend.
+    """
+    if modules is None:
+        modules = light_modules
+
+    failures = []
+    for module, forbidden in modules.items():
+        passed, loaded = import_time(module)
+        violations = [backend for backend in loaded if backend in forbidden]
+
+        status = 'ok' if len(violations) == 0 else f"loads {', '.join(violations)}"
+        print(f"{module:<36} {passed:6.2f}s  {status}")
+
+        if len(violations) > 0:
+            failures.append(module)
+
+    for package, names in lazy_classes.items():
+        for name in names:
+            check = is_class(package, name)
+            status = {True: 'ok', False: 'is not a class',
+                      None: 'skipped (missing dependency)'}[check]
+            print(f"{package + '.' + name:<36} class    {status}")
+
+            if check is False:
+                failures.append(f"{package}.{name}")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if len(benchmark()) > 0 else 0)
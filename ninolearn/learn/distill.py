@@ -0,0 +1,232 @@
+"""
+This module contains the distillation of trained ensembles into one compact
+student network.
+
+For each lead time, the forecast averages the members of the models of all
+spared decades. The student is trained to reproduce the mean and the standard
+deviation of this mixture (the teacher) on the training inputs. It is saved
+like an ensemble with one member, hence it is used with the NumPy inference
+backend (see ninolearn.learn.inference) and its prediction comes in the same
+format as the one of the teacher. TensorFlow is only needed for the training
+of the student.
+"""
+import json
+from os.path import join, exists
+from os import mkdir
+from shutil import rmtree
+
+import numpy as np
+
+from ninolearn import config
+from ninolearn.learn.inference import numpyEnsemble, export_ensemble
+from ninolearn.learn.mixture import from_predictions
+from ninolearn.utils import small_print_header
+
+
+def teacher_mixture(ensembles, X):
+    """
+    The mean and the standard deviation of the mixture of all members of the
+    provided ensembles (e.g. the models of all spared decades of one lead\
+    time).
+
+    :param ensembles: A list of exported ensembles (numpyEnsemble).
+
+    :param X: The features.
+
+    :returns: The mean and the standard deviation, each with the shape\
+    (n_samples, n_heads).
+    """
+    kinds = set(ensemble.mixture['type'] for ensemble in ensembles)
+    if len(kinds) != 1 or 'mean' in kinds:
+        raise ValueError("The ensembles must predict the same type of distribution.")
+
+    pred = np.concatenate([ensemble.predict_members(X) for ensemble in ensembles],
+                          axis=-1)
+    mixture = from_predictions(pred, kinds.pop())
+    return mixture.mean().reshape(len(X), -1), mixture.std().reshape(len(X), -1)
+
+
+class student(object):
+    """
+    A single network that predicts the mean and the standard deviation of a
+    gaussian distribution for one or several targets (heads).
+
+    :param layers: The number of hidden layers.
+
+    :param neurons: The number of neurons in each hidden layer.
+
+    :param activation: The activation function of the hidden layers.
+
+    :param lr: The learning rate.
+
+    :param batch_size: The batch size.
+
+    :param epochs: The maximum number of epochs.
+
+    :param patience: The patience of the early stopping on the 10% of the\
+    samples that are held out for validation.
+    """
+    def __init__(self, layers=1, neurons=32, activation='tanh', lr=0.01,
+                 batch_size=100, epochs=5000, patience=50, verbose=0):
+        self.hyperparameters = dict(layers=layers, neurons=neurons,
+                                    activation=activation, lr=lr,
+                                    batch_size=batch_size, epochs=epochs,
+                                    patience=patience, verbose=verbose)
+        self.n_heads = 1
+        self.ensemble = []
+        self.fidelity = {}
+        self.threading = {}
+
+    @property
+    def n_outputs(self):
+        return 2 * self.n_heads
+
+    @property
+    def output_names(self):
+        if self.n_heads == 1:
+            return ['mean', 'std']
+        return [f'mean{i}' for i in range(self.n_heads)] + \
+               [f'std{i}' for i in range(self.n_heads)]
+
+    def numpy_mixture(self):
+        """
+        The description of the mixture for the NumPy inference backend. The
+        student is a "mixture" of one gaussian.
+        """
+        if self.n_heads == 1:
+            return {'type': 'gaussian'}
+        return {'type': 'gaussian_multi'}
+
+    def build_model(self, n_features):
+        """
+        The method builds the student network and returns it.
+        """
+        from tensorflow.keras.models import Model
+        from tensorflow.keras.layers import Dense, Input, concatenate
+
+        inputs = Input(shape=(n_features,))
+        h = inputs
+        for i in range(self.hyperparameters['layers']):
+            h = Dense(self.hyperparameters['neurons'],
+                      activation=self.hyperparameters['activation'],
+                      name=f'hidden_{i}')(h)
+
+        mu = Dense(self.n_heads, activation='linear', name='mu_output')(h)
+        sigma = Dense(self.n_heads, activation='softplus', name='sigma_output')(h)
+        return Model(inputs=inputs, outputs=concatenate([mu, sigma]))
+
+    def fit(self, X, mean, std):
+        """
+        Train the student to reproduce the mean and the standard deviation of
+        the teacher (see teacher_mixture).
+
+        :param X: The features.
+
+        :param mean: The mean of the teacher with the shape (n_samples, n_heads).
+
+        :param std: The standard deviation of the teacher.
+
+        The fidelity to the teacher (RMSE of the mean and the standard\
+        deviation) is measured on the held-out samples.
+        """
+        config.apply()
+
+        from tensorflow.keras.optimizers import Adam
+        from tensorflow.keras.callbacks import EarlyStopping
+
+        self.n_heads = mean.shape[1]
+        target = np.concatenate((mean, std), axis=1)
+
+        # hold out a random 10% of the samples for the early stopping
+        val = np.random.RandomState(0).rand(len(X)) < 0.1
+
+        model = self.build_model(X.shape[1])
+        model.compile(loss='mse', optimizer=Adam(learning_rate=self.hyperparameters['lr']))
+
+        es = EarlyStopping(monitor='val_loss', min_delta=0.0,
+                           patience=self.hyperparameters['patience'],
+                           verbose=self.hyperparameters['verbose'], mode='min',
+                           restore_best_weights=True)
+
+        model.fit(X[~val], target[~val], validation_data=(X[val], target[val]),
+                  epochs=self.hyperparameters['epochs'],
+                  batch_size=self.hyperparameters['batch_size'],
+                  verbose=self.hyperparameters['verbose'], shuffle=True,
+                  callbacks=[es])
+        self.ensemble = [model]
+        self.threading = config.effective()
+
+        # the fidelity on the held-out samples
+        pred = model.predict(X[val])
+        self.fidelity = {'rmse_mean': float(np.sqrt(np.mean((pred[:, :self.n_heads] - mean[val])**2))),
+                         'rmse_std': float(np.sqrt(np.mean((pred[:, self.n_heads:] - std[val])**2))),
+                         'n_samples': int(val.sum())}
+        print(f"RMSE to the teacher on the held-out samples (mean, std): {self.fidelity['rmse_mean']:.4f}, "
+              f"{self.fidelity['rmse_std']:.4f}")
+
+    def save(self, location='', dir_name='student'):
+        """
+        Save the student network, its NumPy export, the fidelity to the
+        teacher and the threading settings of the training.
+        """
+        from tensorflow.keras.models import save_model
+
+        path = join(location, dir_name)
+        if exists(path):
+            rmtree(path)
+        mkdir(path)
+
+        save_model(self.ensemble[0], join(path, 'member0.h5'), include_optimizer=False)
+        export_ensemble(self, path)
+
+        with open(join(path, 'student.json'), 'w') as f:
+            json.dump({'hyperparameters': self.hyperparameters,
+                       'fidelity': self.fidelity,
+                       'threading': self.threading}, f)
+
+
+def distill(location, dir_names, X, dir_name, **kwargs):
+    """
+    Distill the exported ensembles into one student network and save it.
+
+    :type location: str
+    :param location: The directory of the models (e.g. modeldir).
+
+    :param dir_names: The directory names of the ensembles (the teacher).
+
+    :param X: The training inputs.
+
+    :type dir_name: str
+    :param dir_name: The directory name of the student.
+
+    :param kwargs: The hyperparameters of the student.
+
+    :returns: The trained student.
+    """
+    small_print_header(f'Distill {len(dir_names)} ensembles into {dir_name}')
+
+    ensembles = [numpyEnsemble.load(location, name) for name in dir_names]
+    mean, std = teacher_mixture(ensembles, X)
+
+    model = student(**kwargs)
+    model.fit(X, mean, std)
+    model.save(location=location, dir_name=dir_name)
+    return model
+
+
+def load_fidelity(location, dir_name):
+    """
+    The fidelity of a saved student to its teacher (see student.fit).
+
+    :returns: A dictionary with the RMSE of the mean and the standard\
+    deviation, or None if the student does not exist or its fidelity was\
+    not measured on held-out samples.
+    """
+    path = join(location, dir_name, 'student.json')
+    if not exists(path):
+        return None
+    with open(path) as f:
+        fidelity = json.load(f)['fidelity']
+    if 'n_samples' not in fidelity:
+        return None
+    return fidelity
@@ -3,28 +3,54 @@ This module aims to standardize the training and evaluation procedure.
 """
 import numpy as np
 import pandas as pd
-import xarray as xr
 
-from os.path import join, exists
+from functools import lru_cache
+from os.path import join, exists, basename, dirname
 from os import listdir
+import glob
+import warnings
 
 from ninolearn.utils import print_header, small_print_header
 from ninolearn.pathes import modeldir, processeddir
+from ninolearn.learn.trials import trialStore
+from ninolearn.learn.inference import export_ensemble, exportable
+from ninolearn.learn.distill import distill as distill_ensembles
 
 
-# evaluation decades
-from s0_start import start_pred_y
-decades= np.hstack(([1963], np.arange(1972,start_pred_y,10),[start_pred_y])) 
-decades_elninolike = []
+@lru_cache(maxsize=None)
+def _evaluation_decades():
+    """
+    The evaluation decades. They depend on the start of the predictions in
+    s0_start which is therefore only imported when the decades are used.
+    """
+    from s0_start import start_pred_y
+    decades= np.hstack(([1963], np.arange(1972,start_pred_y,10),[start_pred_y]))
+
+    n_decades = len(decades)
+    decade_name = np.empty(n_decades-1, dtype=object)
+    for i in range(n_decades-1):
+        decade_name[i] = str(decades[i]) + '-' + str(decades[i+1]-1)
 
-n_decades = len(decades)
-decade_name = np.empty(n_decades-1, dtype=object)
-for i in range(n_decades-1):
-    decade_name[i] = str(decades[i]) + '-' + str(decades[i+1]-1)
+    return {'decades': decades, 'decades_elninolike': [],
+            'n_decades': n_decades, 'decade_name': decade_name}
+
+
+def __getattr__(name):
+    """
+    Provides decades, decades_elninolike, n_decades and decade_name as module
+    attributes.
+    """
+    if name in ['decades', 'decades_elninolike', 'n_decades', 'decade_name']:
+        return _evaluation_decades()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 
-def cross_training(model, pipeline, n_iter, lead_times, **kwargs):
+def cross_training(model, pipeline, n_iter, lead_times, n_jobs=1,
+                   search='random', trials=False, joint=False,
+                   warm_start=False, pretrained_patience=None, distill=False,
+                   student_kwargs=None, prune_tol=None, weight_dtype='float32',
+                   weight_tol=None, **kwargs):
     """
     Training the model on different training sets in which each time a period\
     corresponing to a decade out of 1962-1971, 1972-1981, ..., 2012-last \
@@ -38,37 +64,223 @@ def cross_training(model, pipeline, n_iter, lead_times, **kwargs):
 
     :param save_dir: The prefix of the save directory.
 
+    :type n_jobs: int
+    :param n_jobs: The number of worker processes for the random search of\
+    the hyperparameters (see baseModel.fit_RandomizedSearch).
+
+    :type search: str
+    :param search: The search strategy, either 'random' or 'halving' (see\
+    baseModel.fit_RandomizedSearch).
+
+    :type trials: bool
+    :param trials: Record the trials of the search in the persistent trial\
+    store and warm-start from the trials of the previous runs.
+
+    :type joint: bool
+    :param joint: Train one model for all lead times (e.g. a MultiLeadDEM)\
+    instead of one model per lead time. In this case, the pipeline takes the\
+    list of lead times as argument and returns the stacked labels (see\
+    ninolearn.utils.include_lead_labels). The model is initialized with the\
+    keyword argument lead_times. Labels whose target month lies in the\
+    spared decade are masked (NaN) in the training data.
+
+    :type warm_start: bool
+    :param warm_start: Initialize the members with the weights of the\
+    members of the model of the previous lead time for the same decade. Its\
+    training set spares the same decade, hence no test data leaks into the\
+    warm started model. Without such a model (the first lead time and joint\
+    models), the members are initialized randomly. The model must support\
+    the use_pretrained option of the fit method.
+
+    :type pretrained_patience: int
+    :param pretrained_patience: The patience of the early stopping for warm\
+    started models. Default is half the patience of the model.
+
+    :type distill: bool
+    :param distill: After the training of all decades for a lead time, train\
+    one student network that reproduces the mixture of all these models (see\
+    ninolearn.learn.distill). It is saved as {name}_student_{lead name}.
+
+    :type student_kwargs: dict
+    :param student_kwargs: The hyperparameters of the student network\
+    (default hyperparameters if not provided).
+
+    :type prune_tol: float
+    :param prune_tol: If provided, the members of each trained model are\
+    pruned before saving such that the NLL on the held-out segments stays\
+    within this tolerance (see DEM.prune).
+
+    :type weight_dtype: str
+    :param weight_dtype: The precision of the weights in the export for the\
+    NumPy inference ('float32', 'float16' or 'bfloat16'). For reduced\
+    precision, the accuracy is checked against the full precision ensemble\
+    on the training data (see ninolearn.learn.inference.export_ensemble).
+
+    :type weight_tol: float
+    :param weight_tol: If provided, a warning is issued if the maximum\
+    absolute error of the reduced precision export exceeds this tolerance.
+
     :param **kwargs: Arguments that shell be passed to the .set_parameter() \
     method of the provided model.
     """
-
+    if joint:
+        X, y, timey = pipeline(lead_times, return_persistance=False)
+
+        print_header(f'Lead times: {lead_times[0]}-{lead_times[-1]} months')
+
+        # month of the label of each lead time relative to timey
+        lead_offsets = np.asarray(lead_times) - np.min(lead_times)
+
+        dir_names = _cross_training_decades(lambda: model(lead_times=lead_times, **kwargs),
+                                            X, y, timey, 'multilead', -1, n_iter,
+                                            n_jobs, search, trials, warm_start,
+                                            pretrained_patience, prune_tol=prune_tol,
+                                            weight_dtype=weight_dtype,
+                                            weight_tol=weight_tol,
+                                            lead_offsets=lead_offsets)
+        if distill:
+            _distill_lead(dir_names, X, 'multilead', student_kwargs)
+        return
+
+    prev_lead_name = None
     for lead_time in lead_times:
         X, y, timey = pipeline(lead_time, return_persistance=False)
 
         print_header(f'Lead time: {lead_time} months')
 
-        for j in range(n_decades-1):
-            m = model(**kwargs)
-            dir_name = f"{m.hyperparameters['name']}_decade{decades[j]}_lead{lead_time}"
-            path = join(modeldir, dir_name)
+        dir_names = _cross_training_decades(lambda: model(**kwargs), X, y, timey,
+                                            f'lead{lead_time}', lead_time, n_iter,
+                                            n_jobs, search, trials, warm_start,
+                                            pretrained_patience, prev_lead_name,
+                                            prune_tol, weight_dtype, weight_tol)
+        if distill:
+            _distill_lead(dir_names, X, f'lead{lead_time}', student_kwargs)
+        prev_lead_name = f'lead{lead_time}'
+
+
+def _member_files(name, decade, lead_name):
+    """
+    The saved members of a trained model sorted by their number. Returns an
+    empty list if the model does not exist.
+    """
+    files = glob.glob(join(modeldir, f"{name}_decade{decade}_{lead_name}", 'member*.h5'))
+    return sorted(files, key=lambda f: int(basename(f)[6:-3]))
+
+
+def _distill_lead(dir_names, X, lead_name, student_kwargs):
+    """
+    Distill the models of all decades of one lead time into a student
+    network, unless the student already exists.
+    """
+    name = dir_names[0].split('_decade')[0]
+    dir_name = f"{name}_student_{lead_name}"
+
+    if exists(join(modeldir, dir_name, 'numpy_ensemble.npz')):
+        print(f'{dir_name} already exists')
+        return
+    distill_ensembles(modeldir, dir_names, X, dir_name, **(student_kwargs or {}))
 
-            n_files=0
-            if exists(path):
-                n_files = len(listdir(path))
 
-            if not exists(path) or n_files==0:
-                small_print_header(f'Test period: {decades[j]}-01-01 till {decades[j+1]-1}-12-01')
+def _mask_test_labels(y, timey, lead_offsets, start, end):
+    """
+    Returns a copy of the stacked labels (see\
+    ninolearn.utils.include_lead_labels) in which each label whose target\
+    month lies between start and end is NaN.
+
+    :param timey: The target month of the first label column.
 
-                test_indeces = (timey>=f'{decades[j]}-01-01') & (timey<=f'{decades[j+1]-1}-12-01')
-                train_indeces = np.invert(test_indeces)
-                trainX, trainy, traintime = X[train_indeces,:], y[train_indeces], timey[train_indeces]
+    :param lead_offsets: The offset of the target month of each label column\
+    to timey in months.
+    """
+    y = np.array(y, dtype=float)
+    timey = pd.DatetimeIndex(timey)
+    for k, offset in enumerate(lead_offsets):
+        target = timey + pd.DateOffset(months=int(offset))
+        y[(target >= start) & (target <= end), k] = np.nan
+    return y
+
+
+def _cross_training_decades(new_model, X, y, timey, lead_name, lead_time,
+                            n_iter, n_jobs, search, trials, warm_start=False,
+                            pretrained_patience=None, prev_lead_name=None,
+                            prune_tol=None, weight_dtype='float32',
+                            weight_tol=None, lead_offsets=None):
+    """
+    Train and save one model for each spared decade.
 
-                m.fit_RandomizedSearch(trainX, trainy, traintime, n_iter=n_iter)
-                m.save(location=modeldir, dir_name=dir_name)
+    For stacked labels of several lead times, lead_offsets are the offsets\
+    of the target months of the label columns to timey. The labels of the\
+    training rows whose target month lies in the spared decade are masked\
+    (NaN) such that the test decade is not trained on.
 
+    :returns: The directory names of the models.
+    """
+    decades = _evaluation_decades()['decades']
+    dir_names = []
+
+    for j in range(len(decades)-1):
+        m = new_model()
+        name = m.hyperparameters['name']
+        dir_name = f"{name}_decade{decades[j]}_{lead_name}"
+        path = join(modeldir, dir_name)
+        dir_names.append(dir_name)
+
+        n_files=0
+        if exists(path):
+            n_files = len(listdir(path))
+
+        if not exists(path) or n_files==0:
+            small_print_header(f'Test period: {decades[j]}-01-01 till {decades[j+1]-1}-12-01')
+
+            start, end = f'{decades[j]}-01-01', f'{decades[j+1]-1}-12-01'
+            test_indeces = (timey>=start) & (timey<=end)
+            train_indeces = np.invert(test_indeces)
+
+            ydecade = y
+            if lead_offsets is not None:
+                ydecade = _mask_test_labels(y, timey, lead_offsets, start, end)
+            trainX, trainy, traintime = X[train_indeces,:], ydecade[train_indeces], timey[train_indeces]
+
+            store = None
+            if trials:
+                # lead time -1 denotes a joint model for all lead times
+                store = trialStore(m.hyperparameters['name'], lead_time, decades[j])
+
+            fit_kwargs = {}
+            if warm_start:
+                # only a model that spares the same decade may be used, e.g.
+                # the model of another decade was trained on this decade
+                files = []
+                if prev_lead_name is not None:
+                    files = _member_files(name, decades[j], prev_lead_name)
+
+                if len(files) > 0:
+                    print(f"Warm start from {basename(dirname(files[0]))}")
+                    m.pretrained_weights = files
+                    fit_kwargs['use_pretrained'] = True
+
+                    if pretrained_patience is not None:
+                        m.hyperparameters['patience'] = pretrained_patience
+                    elif type(m.hyperparameters['patience']) is int:
+                        m.hyperparameters['patience'] = max(1, m.hyperparameters['patience'] // 2)
+
+            m.fit_RandomizedSearch(trainX, trainy, traintime, n_iter=n_iter, n_jobs=n_jobs,
+                                   search=search, trials=store, **fit_kwargs)
+            if prune_tol is not None:
+                m.prune(trainX, trainy, tol=prune_tol)
+            m.save(location=modeldir, dir_name=dir_name)
+
+            # stacked weights for the inference without TensorFlow
+            if exportable(m):
+                export_ensemble(m, path, dtype=weight_dtype, check_X=trainX,
+                                tol=weight_tol)
             else:
-                print(f'{dir_name} already exists')
-            del m
+                warnings.warn(f"{dir_name} is not supported by the NumPy inference and is not exported.")
+
+        else:
+            print(f'{dir_name} already exists')
+        del m
+    return dir_names
 
 # def cross_hindcast(model, pipeline, model_name, **kwargs):
 #     """
@@ -0,0 +1,371 @@
+"""
+This module contains a TensorFlow-free inference backend for trained
+ensembles (DEM, MultiLeadDEM, qnn, mqnn and ipnn).
+
+The exporter converts the members of an ensemble into stacked NumPy weight
+tensors with the shape (n_members, n_in, n_out) per Dense layer and saves them
+together with the graph of the network in one npz file. The forward pass of
+all members is then evaluated at once with batched matrix products. Neither
+the export file nor the forward pass need TensorFlow, only the export itself
+needs the trained Keras members.
+
+The weights can be stored in reduced precision (float16 or bfloat16). Each
+weight tensor of each member is divided by its maximum absolute value before
+the conversion and the scale is stored in float32 alongside. On loading, the
+weights are converted back and the inference runs in float32.
+"""
+import json
+import warnings
+from os.path import join, exists
+
+import numpy as np
+
+from ninolearn.learn.mixture import from_predictions
+
+filename = 'numpy_ensemble.npz'
+
+dtypes = ['float32', 'float16', 'bfloat16']
+
+_activations = {
+    'linear': lambda x: x,
+    'tanh': np.tanh,
+    'relu': lambda x: np.maximum(x, 0.),
+    'softplus': lambda x: np.logaddexp(0., x),
+    'sigmoid': lambda x: 1. / (1. + np.exp(-x)),
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0.))),
+    'softmax': lambda x: _softmax(x),
+    }
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def _inbound_names(layer_config):
+    """
+    The names of the layers that feed into a layer (Keras functional model
+    config).
+    """
+    if len(layer_config['inbound_nodes']) == 0:
+        return []
+    return [node[0] for node in layer_config['inbound_nodes'][0]]
+
+
+def _graph(member):
+    """
+    The graph of a Keras functional model as a list of nodes in topological
+    order.
+    """
+    config = member.get_config()
+    nodes = []
+    for layer_config in config['layers']:
+        node = {'name': layer_config['name'],
+                'type': layer_config['class_name'],
+                'inputs': _inbound_names(layer_config)}
+
+        if node['type'] == 'Dense':
+            node['activation'] = layer_config['config']['activation']
+            if node['activation'] not in _activations:
+                raise ValueError(f"Activation {node['activation']} is not supported.")
+
+        elif node['type'] not in ['InputLayer', 'GaussianNoise', 'Dropout',
+                                  'Concatenate', 'Add', 'Subtract']:
+            raise ValueError(f"Layer type {node['type']} is not supported.")
+
+        nodes.append(node)
+
+    outputs = [output[0] for output in config['output_layers']]
+    return nodes, outputs
+
+
+def _encode(weights, dtype):
+    """
+    Scale each member's tensor to a maximum absolute value of 1 and convert
+    it to the reduced precision. bfloat16 (not available in NumPy) is stored
+    as the upper 16 bits of the float32 representation (rounded to nearest
+    even).
+
+    :returns: The converted weights and the scales with the shape (n_members,).
+    """
+    axes = tuple(range(1, weights.ndim))
+    scale = np.abs(weights).max(axis=axes, keepdims=True).astype(np.float32)
+    scale[scale == 0] = 1.
+    x = (weights / scale).astype(np.float32)
+
+    if dtype == 'float16':
+        converted = x.astype(np.float16)
+    elif dtype == 'bfloat16':
+        bits = x.view(np.uint32)
+        converted = ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+    return converted, scale.reshape(-1)
+
+
+def _decode(converted, scale, dtype):
+    """
+    Convert reduced precision weights back to float32 (see _encode).
+    """
+    if dtype == 'bfloat16':
+        x = (converted.astype(np.uint32) << 16).view(np.float32)
+    else:
+        x = converted.astype(np.float32)
+    return x * scale.reshape((-1,) + (1,) * (converted.ndim - 1))
+
+
+def exportable(model):
+    """
+    Whether the ensemble of the model can be exported for the NumPy inference,
+    i.e. the model describes its mixture and all layers and activations of
+    its members are supported.
+    """
+    if not hasattr(model, 'numpy_mixture') or len(getattr(model, 'ensemble', [])) == 0:
+        return False
+    try:
+        _graph(model.ensemble[0])
+    except ValueError:
+        return False
+    return True
+
+
+def _export(model):
+    """
+    The stacked float32 weights and the meta data of a trained ensemble.
+    """
+    nodes, outputs = _graph(model.ensemble[0])
+
+    arrays = {}
+    for node in nodes:
+        if node['type'] != 'Dense':
+            continue
+        weights = [member.get_layer(node['name']).get_weights()
+                   for member in model.ensemble]
+        arrays[f"{node['name']}/kernel"] = np.stack([w[0] for w in weights]).astype(np.float32)
+        arrays[f"{node['name']}/bias"] = np.stack([w[1] for w in weights]).astype(np.float32)
+
+    meta = {'nodes': nodes,
+            'outputs': outputs,
+            'mixture': model.numpy_mixture(),
+            'n_outputs': int(model.n_outputs),
+            'output_names': list(model.output_names)}
+    return arrays, meta
+
+
+def _reduce_precision(arrays, dtype):
+    """
+    The weights after a round trip through the reduced precision.
+    """
+    return {key: _decode(*_encode(weights, dtype), dtype)
+            for key, weights in arrays.items()}
+
+
+def precision_error(reference, ensemble, X):
+    """
+    The maximum absolute difference between the predictions of two ensembles
+    (e.g. of the mixture mean and standard deviation).
+
+    :param reference: The full precision ensemble (numpyEnsemble).
+
+    :param ensemble: The reduced precision ensemble (numpyEnsemble).
+
+    :param X: The features.
+
+    :returns: A list with the maximum absolute difference for each output of\
+    the predict method.
+    """
+    pred_ref, pred = reference.predict(X), ensemble.predict(X)
+    if not isinstance(pred_ref, (list, tuple)):
+        pred_ref, pred = [pred_ref], [pred]
+    return [float(np.max(np.abs(np.asarray(a, dtype=float) - np.asarray(b, dtype=float))))
+            for a, b in zip(pred_ref, pred)]
+
+
+def export_ensemble(model, path, dtype='float32', check_X=None, tol=None):
+    """
+    Export a trained ensemble to an npz file in the directory *path* that can
+    be used for inference without TensorFlow (see numpyEnsemble).
+
+    :param model: A trained (or loaded) model, e.g. a DEM.
+
+    :type path: str
+    :param path: The directory of the saved model.
+
+    :type dtype: str
+    :param dtype: The precision of the stored weights ('float32', 'float16'\
+    or 'bfloat16').
+
+    :param check_X: If provided, the predictions of the reduced precision\
+    ensemble for these features are compared to the full precision ensemble\
+    and the maximum absolute errors are printed. They are stored with the\
+    export (see numpyEnsemble.precision_error).
+
+    :type tol: float
+    :param tol: If provided, a warning is issued if one of the errors of the\
+    accuracy check exceeds this tolerance.
+
+    :returns: The errors of the accuracy check (None if no check).
+    """
+    if dtype not in dtypes:
+        raise ValueError(f"dtype must be one of {dtypes}.")
+
+    arrays, meta = _export(model)
+    meta['dtype'] = dtype
+
+    errors = None
+    if dtype != 'float32' and check_X is not None:
+        errors = precision_error(numpyEnsemble(arrays, meta),
+                                 numpyEnsemble(_reduce_precision(arrays, dtype), meta),
+                                 check_X)
+        print(f"Max. abs. error of the {dtype} ensemble: " +
+              ", ".join(f"{name} {error:.2e}" for name, error in
+                        zip(_prediction_names(meta), errors)))
+
+        meta['precision_error'] = dict(zip(_prediction_names(meta), errors))
+        if tol is not None and max(errors) > tol:
+            warnings.warn(f"The {dtype} export of {path} exceeds the tolerance "
+                          f"{tol:.2e} (max. abs. error {max(errors):.2e}).")
+
+    stored = {}
+    for key, weights in arrays.items():
+        if dtype == 'float32':
+            stored[key] = weights
+        else:
+            stored[key], stored[f'{key}/scale'] = _encode(weights, dtype)
+    stored['meta'] = np.array(json.dumps(meta))
+
+    np.savez(join(path, filename), **stored)
+    return errors
+
+
+def _prediction_names(meta):
+    """
+    The names of the outputs of numpyEnsemble.predict.
+    """
+    if meta['mixture']['type'] == 'mean':
+        return ['prediction']
+    elif meta['mixture']['type'] == 'skewed':
+        return ['mean', 'std', 'skewness']
+    return ['mean', 'std']
+
+
+class numpyEnsemble(object):
+    """
+    A trained ensemble that predicts with NumPy only.
+
+    :param arrays: The stacked weights (see export_ensemble).
+
+    :param meta: The graph of the network and the mixture description.
+
+    The maximum absolute errors of the reduced precision weights that were\
+    measured at the export are in the attribute precision_error (None if\
+    they were not checked).
+    """
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.nodes = meta['nodes']
+        self.outputs = meta['outputs']
+        self.mixture = meta['mixture']
+        self.n_outputs = meta['n_outputs']
+        self.output_names = meta['output_names']
+        self.precision_error = meta.get('precision_error')
+
+        dense = [node for node in self.nodes if node['type'] == 'Dense']
+        self.n_members = self.arrays[f"{dense[0]['name']}/kernel"].shape[0]
+
+    @classmethod
+    def load(cls, location, dir_name):
+        """
+        Load an exported ensemble.
+        """
+        path = join(location, dir_name, filename)
+        if not exists(path):
+            raise FileNotFoundError(f"{path} does not exist. Export the ensemble first.")
+
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            dtype = meta.get('dtype', 'float32')
+
+            arrays = {}
+            for key in data.files:
+                if key == 'meta' or key.endswith('/scale'):
+                    continue
+                if dtype == 'float32':
+                    arrays[key] = data[key].astype(np.float32)
+                else:
+                    arrays[key] = _decode(data[key], data[f'{key}/scale'], dtype)
+        return cls(arrays, meta)
+
+    def predict_members(self, X):
+        """
+        The predictions of all members.
+
+        :param X: The features with the shape (n_samples, n_features).
+
+        :returns: An array with the shape (n_samples, n_outputs, n_members).
+        """
+        values = {}
+        for node in self.nodes:
+            inputs = [values[name] for name in node['inputs']]
+
+            if node['type'] == 'InputLayer':
+                # the input is shared by all members
+                out = np.asarray(X, dtype=np.float32)[np.newaxis]
+
+            elif node['type'] == 'Dense':
+                kernel = self.arrays[f"{node['name']}/kernel"]
+                bias = self.arrays[f"{node['name']}/bias"]
+                out = np.matmul(inputs[0], kernel) + bias[:, np.newaxis, :]
+                out = _activations[node['activation']](out)
+
+            elif node['type'] in ['GaussianNoise', 'Dropout']:
+                out = inputs[0]
+
+            elif node['type'] == 'Concatenate':
+                out = np.concatenate(np.broadcast_arrays(*inputs), axis=-1)
+
+            elif node['type'] == 'Add':
+                out = sum(inputs)
+
+            elif node['type'] == 'Subtract':
+                out = inputs[0] - inputs[1]
+
+            values[node['name']] = out
+
+        out = np.concatenate([values[name] for name in self.outputs], axis=-1)
+        out = np.broadcast_to(out, (self.n_members,) + out.shape[1:])
+        return np.transpose(out, (1, 2, 0))
+
+    def predict(self, X):
+        """
+        Generates the ensemble prediction in the same format as the predict
+        method of the exported model.
+
+        :param X: The features with the shape (n_samples, n_features).
+        """
+        return self._mixture(self.predict_members(X))
+
+    def _mixture(self, pred):
+        """
+        returns the ensemble mixture results
+        """
+        mixture = self.mixture['type']
+
+        if mixture == 'mean':
+            mix_mean = pred.mean(axis=2)
+            if self.mixture.get('transpose', False):
+                return mix_mean.T
+            return mix_mean[:, 0]
+
+        mixture = from_predictions(pred, mixture)
+        if self.mixture['type'] == 'skewed':
+            return mixture.mean(), mixture.std(), mixture.skewness()
+        return [mixture.mean(), mixture.std()]
+
+    def predict_mixture(self, X):
+        """
+        Returns the predicted mixture distribution (see\
+        ninolearn.learn.mixture). Only for the models which predict the\
+        parameters of a distribution.
+        """
+        if self.mixture['type'] == 'mean':
+            raise ValueError("The ensemble does not predict a distribution.")
+        return from_predictions(self.predict_members(X), self.mixture['type'])
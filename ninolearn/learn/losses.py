@@ -1,3 +1,4 @@
+import tensorflow as tf
 import tensorflow.keras.backend as K
 
 def nll_gaussian(y_true, y_pred):
@@ -15,6 +16,29 @@ def nll_gaussian(y_true, y_pred):
     return loss
 
 
+def nll_gaussian_masked(y_true, y_pred):
+    """
+    Negative - log -likelihood for the prediction of gaussian probabilities for
+    several targets (e.g. lead times) at once. The first half of the
+    predictions are the means, the second half the standard deviations.
+    Targets that are NaN (e.g. beyond the end of the data) are masked.
+    """
+    n_targets = K.shape(y_true)[1]
+    mean = y_pred[:, :n_targets]
+    sigma = y_pred[:, n_targets:] + 1e-6 # adding 1-e6 for numerical stability reasons
+
+    mask = tf.math.is_finite(y_true)
+    y = tf.where(mask, y_true, mean)
+    mask = K.cast(mask, K.floatx())
+
+    first  =  0.5 * K.log(K.square(sigma))
+    second =  K.square(y - mean) / (2  * K.square(sigma))
+    summed = (first + second) * mask
+
+    loss = K.sum(summed) / K.maximum(K.sum(mask), 1.)
+    return loss
+
+
 def nll_skewed_gaussian(y_true, y_pred):
     """
     Negative - log -likelihood for the prediction of a gaussian probability
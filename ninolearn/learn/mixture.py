@@ -0,0 +1,290 @@
+"""
+This module contains the mixture statistics of the ensemble models.
+
+The predictions of all members are treated in one batched pass. The member
+parameters come with the members as the last axis, e.g. the arrays with the
+shape (n, n_members) that are cut out of the (n, outputs, n_members) output of
+the models. The mixtures provide the mean, the variance, the skewness,
+the CDF and arbitrary quantiles. The quantiles are found by a vectorized
+bisection of the CDF over all samples and levels at once.
+"""
+import numpy as np
+from scipy.special import ndtr, log_ndtr, owens_t, logsumexp
+
+# np.trapz was renamed to np.trapezoid in numpy 2
+_trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+
+class baseMixture(object):
+    """
+    An equally weighted mixture of the member distributions. Child classes
+    provide the moments and the CDF of the members.
+    """
+    def _member_moments(self):
+        """
+        The mean, the variance and the third central moment of each member.
+        """
+        raise NameError("Function '_member_moments' is not defined")
+
+    def _member_cdf(self, y):
+        """
+        The CDF of each member at y, where y has a trailing members axis.
+        """
+        raise NameError("Function '_member_cdf' is not defined")
+
+    def _member_logpdf(self, y):
+        """
+        The log-density of each member at y, where y has a trailing members\
+        axis.
+        """
+        raise NameError("Function '_member_logpdf' is not defined")
+
+    def _bracket(self):
+        """
+        Lower and upper bounds which include all quantiles of interest.
+        """
+        mean, var, _ = self._member_moments()
+        std = np.sqrt(var)
+        return (mean - 10 * std).min(axis=-1), (mean + 10 * std).max(axis=-1)
+
+    def mean(self):
+        return self._member_moments()[0].mean(axis=-1)
+
+    def var(self):
+        mean, var, _ = self._member_moments()
+        return np.mean(var + mean**2, axis=-1) - self.mean()**2
+
+    def std(self):
+        return np.sqrt(self.var())
+
+    def skewness(self):
+        """
+        The skewness of the mixture. The third central moment of the mixture
+        is the average of the third moments of the members around the
+        mixture mean.
+        """
+        mean, var, mu3 = self._member_moments()
+        d = mean - self.mean()[..., np.newaxis]
+        third = np.mean(mu3 + 3 * var * d + d**3, axis=-1)
+        return third / self.var()**1.5
+
+    def cdf(self, y):
+        """
+        The CDF of the mixture.
+
+        :param y: The values with the shape of the mixture (without the\
+        members axis) plus one trailing axis for several values per sample.
+
+        :returns: An array with the shape of y.
+        """
+        y = np.asarray(y, dtype=float)
+        return self._member_cdf(y[..., np.newaxis]).mean(axis=-1)
+
+    def logpdf(self, y):
+        """
+        The log-density of the mixture.
+
+        :param y: The values with the shape of the mixture (without the\
+        members axis).
+        """
+        y = np.asarray(y, dtype=float)
+        logpdf = self._member_logpdf(y[..., np.newaxis])
+        return logsumexp(logpdf, axis=-1) - np.log(logpdf.shape[-1])
+
+    def nll(self, y):
+        """
+        The negative-log-likelihood of the observations y averaged over all
+        samples. NaN observations are ignored.
+        """
+        y = np.asarray(y, dtype=float)
+        mask = np.isfinite(y)
+        return -np.mean(self.logpdf(np.where(mask, y, 0.))[mask])
+
+    def quantile(self, levels, tol=1e-6, max_iter=100):
+        """
+        The quantiles of the mixture by vectorized bisection of the CDF.
+
+        :param levels: The quantile levels (between 0 and 1).
+
+        :param tol: The absolute tolerance of the quantiles.
+
+        :param max_iter: The maximum number of bisection steps.
+
+        :returns: An array with the shape of the mixture plus a trailing axis\
+        for the levels.
+        """
+        levels = np.asarray(levels, dtype=float)
+        low, high = self._bracket()
+
+        shape = low.shape + levels.shape
+        low = np.broadcast_to(low[..., np.newaxis], shape).copy()
+        high = np.broadcast_to(high[..., np.newaxis], shape).copy()
+
+        for _ in range(max_iter):
+            mid = 0.5 * (low + high)
+            below = self.cdf(mid) < levels
+            low = np.where(below, mid, low)
+            high = np.where(below, high, mid)
+            if np.max(high - low) < tol:
+                break
+        return 0.5 * (low + high)
+
+
+class gaussianMixture(baseMixture):
+    """
+    A mixture of gaussian distributions (e.g. the DEM with pdf='normal').
+
+    :param mu: The means of the members (members as last axis).
+
+    :param sigma: The standard deviations of the members.
+    """
+    def __init__(self, mu, sigma):
+        self.mu = np.asarray(mu, dtype=float)
+        self.sigma = np.asarray(sigma, dtype=float)
+
+    def _member_moments(self):
+        return self.mu, self.sigma**2, np.zeros_like(self.mu)
+
+    def _member_cdf(self, y):
+        return ndtr((y - self.mu[..., np.newaxis, :]) / self.sigma[..., np.newaxis, :])
+
+    def _member_logpdf(self, y):
+        x = (y - self.mu) / self.sigma
+        return -0.5 * x**2 - np.log(self.sigma) - 0.5 * np.log(2 * np.pi)
+
+
+class skewedGaussianMixture(baseMixture):
+    """
+    A mixture of skewed gaussian distributions (e.g. the DEM with\
+    pdf='skewed') with the density 2/scale * phi(x) * Phi(shape * x) where\
+    x = (y - location)/scale.
+
+    :param location: The locations of the members (members as last axis).
+
+    :param scale: The scales of the members.
+
+    :param shape: The shape parameters of the members.
+    """
+    def __init__(self, location, scale, shape):
+        self.location = np.asarray(location, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.shape = np.asarray(shape, dtype=float)
+
+    def _member_moments(self):
+        delta = self.shape / np.sqrt(1 + self.shape**2)
+        b = delta * np.sqrt(2 / np.pi)
+
+        mean = self.location + self.scale * b
+        var = self.scale**2 * (1 - b**2)
+        mu3 = (4 - np.pi) / 2 * (self.scale * b)**3
+        return mean, var, mu3
+
+    def _member_cdf(self, y):
+        x = (y - self.location[..., np.newaxis, :]) / self.scale[..., np.newaxis, :]
+        shape = np.broadcast_to(self.shape[..., np.newaxis, :], x.shape)
+        return ndtr(x) - 2 * owens_t(x, shape)
+
+    def _member_logpdf(self, y):
+        x = (y - self.location) / self.scale
+        return np.log(2 / self.scale) - 0.5 * x**2 - 0.5 * np.log(2 * np.pi) \
+            + log_ndtr(self.shape * x)
+
+
+class quantileEnsemble(baseMixture):
+    """
+    The mixture of a quantile regression ensemble (e.g. qnn or mqnn). The
+    quantiles of the members are averaged for each level. Between the levels,
+    the quantile function is interpolated linearly. Beyond the outermost
+    levels, it is constant.
+
+    :param pred: The predicted quantiles with the shape\
+    (n, n_levels, n_members).
+
+    :param levels: The quantile levels of the outputs in ascending order.
+    """
+    def __init__(self, pred, levels):
+        self.levels = np.asarray(levels, dtype=float)
+        if np.any(np.diff(self.levels) <= 0):
+            raise ValueError("The quantile levels must be in ascending order.")
+
+        # averaged quantiles, sorted such that they do not cross
+        self.values = np.sort(np.asarray(pred, dtype=float).mean(axis=-1), axis=-1)
+
+    def _bracket(self):
+        return self.values[:, 0], self.values[:, -1]
+
+    def _quantile_function(self):
+        """
+        The nodes of the piecewise linear quantile function on [0, 1].
+        """
+        levels = np.concatenate(([0.], self.levels, [1.]))
+        values = np.concatenate((self.values[:, :1], self.values,
+                                 self.values[:, -1:]), axis=1)
+        return levels, values
+
+    def mean(self):
+        levels, values = self._quantile_function()
+        return _trapezoid(values, levels, axis=-1)
+
+    def var(self):
+        levels, values = self._quantile_function()
+        return _trapezoid(values**2, levels, axis=-1) - self.mean()**2
+
+    def skewness(self):
+        levels, values = self._quantile_function()
+        third = _trapezoid((values - self.mean()[:, np.newaxis])**3, levels, axis=-1)
+        return third / self.var()**1.5
+
+    def cdf(self, y):
+        y = np.asarray(y, dtype=float)
+        values = self.values[:, np.newaxis, :]
+
+        # index of the interval in which y lies
+        k = np.sum(values <= y[..., np.newaxis], axis=-1)
+        k_low = np.clip(k - 1, 0, len(self.levels) - 1)
+        k_high = np.clip(k, 0, len(self.levels) - 1)
+
+        v_low = np.take_along_axis(self.values, k_low, axis=-1)
+        v_high = np.take_along_axis(self.values, k_high, axis=-1)
+        width = np.where(v_high > v_low, v_high - v_low, 1.)
+        t = np.clip((y - v_low) / width, 0., 1.)
+
+        cdf = self.levels[k_low] + t * (self.levels[k_high] - self.levels[k_low])
+        cdf = np.where(k == 0, 0., cdf)
+        return np.where(k == len(self.levels), 1., cdf)
+
+    def quantile(self, levels):
+        """
+        The quantiles at arbitrary levels by linear interpolation.
+        """
+        levels = np.asarray(levels, dtype=float)
+        nodes, values = self._quantile_function()
+
+        k = np.clip(np.searchsorted(nodes, levels, side='right') - 1, 0, len(nodes) - 2)
+        t = (levels - nodes[k]) / (nodes[k+1] - nodes[k])
+        return values[:, k] + t * (values[:, k+1] - values[:, k])
+
+
+def from_predictions(pred, kind, levels=None):
+    """
+    Returns the mixture for the member predictions of a model.
+
+    :param pred: The predictions of the members with the shape\
+    (n, outputs, n_members).
+
+    :type kind: str
+    :param kind: 'gaussian' (outputs: mean, std), 'skewed' (outputs:\
+    location, scale, shape), 'gaussian_multi' (outputs: means for each target\
+    followed by the standard deviations) or 'quantile' (outputs: quantiles\
+    at the given levels).
+    """
+    if kind == 'gaussian':
+        return gaussianMixture(pred[:, 0, :], pred[:, 1, :])
+    elif kind == 'skewed':
+        return skewedGaussianMixture(pred[:, 0, :], pred[:, 1, :], pred[:, 2, :])
+    elif kind == 'gaussian_multi':
+        n_targets = pred.shape[1] // 2
+        return gaussianMixture(pred[:, :n_targets, :], pred[:, n_targets:, :])
+    elif kind == 'quantile':
+        return quantileEnsemble(pred, levels)
+    raise ValueError(f"Unknown mixture kind {kind}.")
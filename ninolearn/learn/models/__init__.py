@@ -1,6 +1,41 @@
 # -*- coding: utf-8 -*-
+"""
+The models are imported on first use (e.g. ninolearn.learn.models.DEM), such
+that TensorFlow is only loaded when a model is actually needed.
+"""
+import sys
+from importlib import import_module
+from types import ModuleType
 
-from .baseModel import baseModel
-from .dem import DEM
-from .encoderDecoder import EncoderDecoder
-from .ipnn import ipnn
\ No newline at end of file
+_models = {'baseModel': '.baseModel',
+           'DEM': '.dem',
+           'EncoderDecoder': '.encoderDecoder',
+           'ipnn': '.ipnn',
+           'MultiLeadDEM': '.multiLeadDEM'}
+
+
+class _modelsPackage(ModuleType):
+    """
+    The import of a submodule binds it to the package. The submodules
+    baseModel and ipnn have the names of their classes, hence the class is
+    bound instead (as with the former "from .ipnn import ipnn").
+    """
+    def __setattr__(self, name, value):
+        if name in _models and isinstance(value, ModuleType):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _modelsPackage
+
+
+def __getattr__(name):
+    if name in _models:
+        model = getattr(import_module(_models[name], __name__), name)
+        globals()[name] = model
+        return model
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_models))
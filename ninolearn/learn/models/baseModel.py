@@ -1,8 +1,541 @@
 import numpy as np
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import pandas as pd
+import multiprocessing
+import importlib
+import warnings
+import json
+import glob
+import time
+from os import cpu_count, mkdir, makedirs, getcwd
+from os.path import join, exists, basename
+from shutil import rmtree
 
-class baseModel(object):
+from ninolearn.learn.trials import data_version, config_string
+from ninolearn import config
+from ninolearn.utils import small_print_header
+from ninolearn.exceptions import MissingArgumentError
+
+# training templates (see ensembleTrainer._template) of the recently used
+# architectures
+_templates = OrderedDict()
+_max_templates = 8
+
+# the number of Keras models that were built since the session was cleared the
+# last time (see _clear_session)
+_n_built = 0
+_max_built = 500
+
+# hyperparameters that do not change the architecture or the loss of a member
+_training_keys = ['lr', 'batch_size', 'epochs', 'patience', 'verbose',
+                  'n_segments', 'n_members_segment', 'n_members', 'engine',
+                  'check_every', 'name']
+
+
+def _init_worker(slots, n_workers, settings):
+    """
+    Configure a new worker process of a parallel hyperparameter search. The
+    worker takes one of the slots and is pinned to the share of the cores of
+    this slot (see ninolearn.config.apply). Its thread environment variables
+    were already set when it was spawned (see\
+    ninolearn.config.worker_environment).
+    """
+    config.settings.update(settings)
+    config.apply(worker=slots.get(), n_workers=n_workers)
+
+
+def _fit_candidate(args):
+    """
+    Fit one candidate of a parallel hyperparameter search in a worker process
+    and return the trained ensemble as numpy weights. The model is rebuilt
+    from its specification (see baseModel._worker_spec()).
+    """
+    spec, hyperparameters, seed, trainX, trainy, timey, kwargs = args
+    module, name, (init_args, init_kwargs), attributes = spec
+
+    # the model module imports TensorFlow
+    model = getattr(importlib.import_module(module), name)(*init_args, **init_kwargs)
+    model.__dict__.update(attributes)
+
+    import tensorflow as tf
+    np.random.seed(seed)
+    tf.random.set_seed(seed)
+
+    model.hyperparameters = hyperparameters
+    model.fit(trainX, trainy, timey=timey, **kwargs)
+    return model._ensemble_state()
+
+
+def _clear_session(n_members):
+    """
+    Each trained member is copied into a new Keras model whose graph stays in
+    the Keras session. Before a training of n_members members, the session is
+    cleared if more than _max_built models were built since the last clear.
+    The training templates are built in the old session and are evicted as
+    well. Models that were built before remain usable.
+    """
+    global _n_built
+    if _n_built + n_members > _max_built:
+        import tensorflow.keras.backend as K
+        K.clear_session()
+        _templates.clear()
+        _n_built = 0
+    _n_built += n_members
+
+
+class ensembleTrainer(object):
+    """
+    The training procedure that is shared by the ensemble models. The
+    training data is split into n_segments segments. For each segment,
+    n_members_segment members are trained on the remaining segments and
+    validated (early stopping) on the spared segment. If n_segments is 1, a
+    validation data set must be provided.
+
+    A model only supplies the method .build_model() that returns a new
+    (uncompiled) Keras member, the loss (attributes loss and loss_name) and
+    the hyperparameters n_segments, n_members_segment, lr, batch_size,
+    epochs, patience and verbose. The optional hyperparameters engine and
+    check_every select the training engine of the members (see .fit_member()).
+
+    The trained members can be checkpointed such that an interrupted training
+    resumes with the next member (see .fit_ensemble()). The ensemble is saved
+    and loaded with .save() and .load(). The threading settings of the
+    training (see ninolearn.config) are saved with the ensemble.
+    """
+    def _build_member(self, trainX, trainy):
+        """
+        Returns a new member for the given data.
+        """
+        return self.build_model(trainX.shape[1])
+
+    def load_pretrained(self, member, i):
+        """
+        Initialize the i-th ensemble member with pretrained weights.
+
+        The attribute pretrained_weights is either the path to a weight file
+        that is used for all members or a list of paths (e.g. the members of
+        an ensemble that was trained for a neighbouring lead time or decade)
+        that are used in turn. In the latter case, a member whose
+        architecture does not match keeps its random initialization.
+        """
+        if type(self.pretrained_weights) is str:
+            member.load_weights(self.pretrained_weights)
+            return
+
+        path = self.pretrained_weights[i % len(self.pretrained_weights)]
+        try:
+            member.load_weights(path)
+        except ValueError as e:
+            warnings.warn(f"Could not load the pretrained weights {path}: {e}")
+
+    def _segments(self, trainX, trainy, valX=None, valy=None):
+        """
+        Returns the training and the validation data for each segment.
+        """
+        n_segments = self.hyperparameters['n_segments']
+
+        if n_segments == 1:
+            if valX is None or valy is None:
+                raise MissingArgumentError("When segments length is 1, a validation data set must be provided.")
+            warnings.warn("Validation and test data set are the same if n_segements is 1!")
+            return [(trainX, trainy, valX, valy)]
+
+        if valX is not None or valy is not None:
+            warnings.warn("Validation data set will be one of the segments. The provided validation data set is not used!")
+
+        self.segment_len = trainX.shape[0]//n_segments
+
+        segments = []
+        for j in range(n_segments):
+            val = np.zeros(trainX.shape[0], dtype=bool)
+            val[j * self.segment_len:(j+1) * self.segment_len] = True
+            segments.append((trainX[~val], trainy[~val], trainX[val], trainy[val]))
+        return segments
+
+    def _member_schedule(self):
+        """
+        The segment on which each member is validated. Member\
+        i*n_segments + j is validated on segment j.
+        """
+        return [j for i in range(self.hyperparameters['n_members_segment'])
+                for j in range(self.hyperparameters['n_segments'])]
+
+    def _template_key(self, trainX, trainy):
+        """
+        Identifies the architecture and the loss of the members, i.e. all
+        hyperparameters except for the settings of the training.
+        """
+        keys = [key for key in self.hyperparameters.keys() if key not in _training_keys]
+        output_names = tuple(getattr(self, 'output_names', []))
+        return (type(self).__name__, self.loss_name, output_names,
+                config_string(self.hyperparameters, keys),
+                trainX.shape[1:], np.shape(trainy)[1:])
+
+    def _template(self, trainX, trainy):
+        """
+        Returns the training template for the architecture of the members.
+        The template is a compiled member (with its optimizer, EarlyStopping
+        callback and compiled training steps) that is built once per
+        architecture and reused for all members, hyperparameter candidates
+        and models of the same architecture.
+        """
+        from tensorflow.keras.optimizers import Adam
+        from tensorflow.keras.callbacks import EarlyStopping
+
+        key = self._template_key(trainX, trainy)
+        if key in _templates:
+            _templates.move_to_end(key)
+            return _templates[key]
+
+        model = self._build_member(trainX, trainy)
+        model.compile(loss=self.loss, metrics=[self.loss],
+                      optimizer=Adam(learning_rate=self.hyperparameters['lr'],
+                                     beta_1=0.9, beta_2=0.999, amsgrad=False))
+
+        es = EarlyStopping(monitor=f'val_{self.loss_name}', min_delta=0.0,
+                           patience=self.hyperparameters['patience'], verbose=1,
+                           mode='min', restore_best_weights=True)
+
+        _templates[key] = {'model': model, 'es': es, 'steps': None}
+        if len(_templates) > _max_templates:
+            _templates.popitem(last=False)
+        return _templates[key]
+
+    def _reset_template(self, template):
+        """
+        Re-initialize the weights of the template with fresh random values
+        and reset the state of its optimizer.
+        """
+        import tensorflow.keras.backend as K
+
+        model = template['model']
+        for layer in model.submodules:
+            for name in ['kernel', 'bias']:
+                variable = getattr(layer, name, None)
+                initializer = getattr(layer, f'{name}_initializer', None)
+                if variable is None or initializer is None:
+                    continue
+
+                # unseeded initializers return the same values on each call
+                config = initializer.get_config()
+                if 'seed' in config:
+                    config['seed'] = np.random.randint(2**31 - 1)
+                    initializer = type(initializer).from_config(config)
+                variable.assign(initializer(variable.shape, dtype=variable.dtype))
+
+        variables = model.optimizer.variables
+        for variable in (variables() if callable(variables) else variables):
+            variable.assign(np.zeros(variable.shape, dtype=variable.dtype.as_numpy_dtype))
+        K.set_value(model.optimizer.learning_rate, self.hyperparameters['lr'])
+        template['es'].patience = self.hyperparameters['patience']
+
+    def fit_member(self, member, trainX, trainy, valX, valy):
+        """
+        Train one (compiled) member. Either with the Keras fit method and an
+        EarlyStopping callback (engine='keras', default) or with the compiled
+        training loop (engine='compiled', see ._fit_member_compiled()).
+
+        :returns: The history and the validation loss.
+        """
+        if self.hyperparameters.get('engine', 'keras') == 'compiled':
+            history = self._fit_member_compiled(member, trainX, trainy, valX, valy)
+            return history, min(history['val_loss'])
+
+        history = member.fit(trainX, trainy,
+                             epochs=self.hyperparameters['epochs'],
+                             batch_size=self.hyperparameters['batch_size'],
+                             verbose=self.hyperparameters['verbose'],
+                             shuffle=True, callbacks=[self.es],
+                             validation_data=(valX, valy))
+        return history, member.evaluate(valX, valy, verbose=0)[1]
+
+    def _compiled_steps(self, member):
+        """
+        The compiled training and validation steps of the template. The data
+        and the batch size are arguments, hence the steps are traced once
+        per template and not for each member.
+        """
+        import tensorflow as tf
+
+        template = self._current_template
+        if template['steps'] is not None:
+            return template['steps']
+
+        loss_fn = tf.keras.losses.get(self.loss)
+        optimizer = member.optimizer
+
+        @tf.function
+        def train_epochs(X, y, n_epochs, batch_size):
+            n_samples = tf.shape(X)[0]
+            n_batches = (n_samples + batch_size - 1) // batch_size
+            for _ in tf.range(n_epochs):
+                perm = tf.random.shuffle(tf.range(n_samples))
+                for b in tf.range(n_batches):
+                    idx = perm[b * batch_size:(b + 1) * batch_size]
+                    Xb, yb = tf.gather(X, idx), tf.gather(y, idx)
+                    with tf.GradientTape() as tape:
+                        loss = tf.reduce_mean(loss_fn(yb, member(Xb, training=True)))
+                        if member.losses:
+                            loss += tf.add_n(member.losses)
+                    grads = tape.gradient(loss, member.trainable_variables)
+                    optimizer.apply_gradients(zip(grads, member.trainable_variables))
+
+        @tf.function
+        def validation_loss(X, y):
+            return tf.reduce_mean(loss_fn(y, member(X, training=False)))
+
+        template['steps'] = (train_epochs, validation_loss)
+        return template['steps']
+
+    def _fit_member_compiled(self, member, trainX, trainy, valX, valy):
+        """
+        Train an ensemble member with a custom training loop. The (small)
+        data set is kept as tensors and the epochs run inside a compiled
+        tf.function. The early stopping criterion (same as for the
+        EarlyStopping callback) is checked every *check_every* epochs and the
+        best weights are restored at the end.
+
+        :returns: A dictionary with the validation loss at each check.
+        """
+        import tensorflow as tf
+
+        X = tf.constant(trainX, dtype=tf.float32)
+        y = tf.constant(trainy.reshape(len(trainy), -1), dtype=tf.float32)
+        Xval = tf.constant(valX, dtype=tf.float32)
+        yval = tf.constant(valy.reshape(len(valy), -1), dtype=tf.float32)
+        batch_size = tf.constant(self.hyperparameters['batch_size'])
+
+        train_epochs, validation_loss = self._compiled_steps(member)
+
+        epochs = self.hyperparameters['epochs']
+        patience = self.hyperparameters['patience']
+        check_every = max(1, self.hyperparameters.get('check_every', 10))
+
+        history = {'epoch': [], 'val_loss': []}
+        best_loss, best_weights = np.inf, member.get_weights()
+        epoch, wait = 0, 0
+        while epoch < epochs and wait < patience:
+            n_epochs = min(check_every, epochs - epoch)
+            train_epochs(X, y, tf.constant(n_epochs), batch_size)
+            epoch += n_epochs
+
+            val_loss = float(validation_loss(Xval, yval))
+            history['epoch'].append(epoch)
+            history['val_loss'].append(val_loss)
+
+            if val_loss < best_loss:
+                best_loss, best_weights = val_loss, member.get_weights()
+                wait = 0
+            else:
+                wait += n_epochs
+
+            if self.hyperparameters['verbose']:
+                print(f"Epoch {epoch}: val_{self.loss_name} {val_loss}")
+
+        if wait >= patience:
+            print(f"Epoch {epoch}: early stopping")
+
+        member.set_weights(best_weights)
+        return history
+
+    def fit_ensemble(self, trainX, trainy, valX=None, valy=None,
+                     use_pretrained=False, checkpoint=None):
+        """
+        Train the members of the ensemble. All members are trained on the
+        training template of their architecture (see ._template()) whose
+        weights are re-initialized for each member. The trained weights are
+        then copied into a new (uncompiled) member. The Keras session is
+        cleared from time to time (see _clear_session()).
+
+        :param trainX: The training features.
+
+        :param trainy: The training labels.
+
+        :param valX, valy: The validation data set (only used if n_segments\
+        is 1).
+
+        :type use_pretrained: bool
+        :param use_pretrained: Initialize the members with the weights given\
+        in the attribute pretrained_weights (see .load_pretrained()).
+
+        :type checkpoint: str
+        :param checkpoint: A directory in which each member is saved after its\
+        training. If the training is started again with the same\
+        hyperparameters and the same data, the members that are already in\
+        the directory are loaded instead of trained again.
+        """
+        start_time = time.time()
+
+        config.apply()
+
+        self.hyperparameters['n_members'] = self.hyperparameters['n_segments'] * self.hyperparameters['n_members_segment']
+        _clear_session(self.hyperparameters['n_members'] + 1)
+
+        # allocate lists for the ensemble
+        self.ensemble = []
+        self.history = []
+        self.val_loss = []
+        self.member_segments = None
+
+        segments = self._segments(trainX, trainy, valX, valy)
+        restored = self._load_checkpoint(checkpoint, trainX, trainy)
+
+        self._current_template = self._template(trainX, trainy)
+        template = self._current_template['model']
+        self.optimizer = template.optimizer
+        self.es = self._current_template['es']
+
+        for k, j in enumerate(self._member_schedule()):
+            small_print_header(f"Train member Nr {k+1}/{self.hyperparameters['n_members']}")
+
+            if k < len(restored):
+                print("Restored from checkpoint")
+                member, val_loss = restored[k]
+                history = None
+            else:
+                self._reset_template(self._current_template)
+                if use_pretrained:
+                    self.load_pretrained(template, k)
+
+                history, val_loss = self.fit_member(template, *segments[j % len(segments)])
+
+                member = self._build_member(trainX, trainy)
+                member.set_weights(template.get_weights())
+                self._save_checkpoint(checkpoint, member, val_loss, trainX, trainy)
+
+            self.history.append(history)
+            self.val_loss.append(val_loss)
+            self.ensemble.append(member)
+
+        self.mean_val_loss = np.mean(self.val_loss)
+        self.threading = config.effective()
+
+        print(f'Loss: {self.mean_val_loss}')
+        # print computation time
+        end_time = time.time()
+        passed_time = np.round(end_time-start_time, decimals=1)
+        print(f'Computation time: {passed_time}s')
+
+    def _checkpoint_id(self, trainX, trainy):
+        """
+        Identifies the hyperparameters and the data of a checkpoint.
+        """
+        keys = [key for key in self.hyperparameters.keys() if key != 'verbose']
+        return {'config': config_string(self.hyperparameters, keys),
+                'data': data_version(trainX, trainy)}
+
+    def _load_checkpoint(self, checkpoint, trainX, trainy):
+        """
+        Returns the members (and their validation losses) that were already
+        trained with the same hyperparameters and data.
+        """
+        if checkpoint is None or not exists(join(checkpoint, 'checkpoint.json')):
+            return []
+
+        with open(join(checkpoint, 'checkpoint.json')) as file:
+            state = json.load(file)
+        if state['id'] != self._checkpoint_id(trainX, trainy):
+            return []
+
+        from tensorflow.keras.models import load_model
+        return [(load_model(join(checkpoint, f'member{k}.h5'), compile=False), loss)
+                for k, loss in enumerate(state['val_loss'])]
+
+    def _save_checkpoint(self, checkpoint, member, val_loss, trainX, trainy):
+        """
+        Save a trained member to the checkpoint directory. The checkpoint is
+        started anew with the first member that is trained.
+        """
+        if checkpoint is None:
+            return
+
+        from tensorflow.keras.models import save_model
+
+        k = len(self.ensemble)
+        if k == 0 and exists(checkpoint):
+            rmtree(checkpoint)
+        if not exists(checkpoint):
+            makedirs(checkpoint)
+
+        save_model(member, join(checkpoint, f'member{k}.h5'), include_optimizer=False)
+
+        state = {'id': self._checkpoint_id(trainX, trainy),
+                 'val_loss': [float(loss) for loss in self.val_loss + [val_loss]]}
+        with open(join(checkpoint, 'checkpoint.json'), 'w') as file:
+            json.dump(state, file)
+
+    def save(self, location='', dir_name='ensemble'):
+        """
+        Save the ensemble. The members are saved as member{i}.h5 together with
+        the hyperparameters (and the history of the hyperparameter search) and
+        the threading settings of the training.
+        """
+        from tensorflow.keras.models import save_model
+
+        path = join(location, dir_name)
+        if exists(path):
+            rmtree(path)
+        mkdir(path)
+
+        if hasattr(self, 'df_history_hyp'):
+            self.df_history_hyp.to_csv(join(path, 'hyperparameters_history.csv'))
+
+        with open(join(path, 'hyperparameters.json'), 'w') as file:
+            file.write(config_string(self.hyperparameters, self.hyperparameters.keys()))
+
+        with open(join(path, 'threading.json'), 'w') as file:
+            json.dump(getattr(self, 'threading', config.effective()), file)
+
+        # the validation segments of the members of a pruned ensemble
+        if getattr(self, 'member_segments', None) is not None:
+            np.save(join(path, 'member_segments.npy'), self.member_segments)
+
+        for i, member in enumerate(self.ensemble):
+            path_h5 = join(path, f"member{i}.h5")
+            save_model(member, path_h5, include_optimizer=False)
+
+    def load(self, location=None, dir_name='ensemble'):
+        """
+        Load the ensemble.
+        """
+        from tensorflow.keras.models import load_model
+
+        if location is None:
+            location = getcwd()
+
+        path = join(location, dir_name)
+        files = sorted(glob.glob(join(path, 'member*.h5')),
+                       key=lambda f: int(basename(f)[6:-3]))
+        if len(files) == 0:
+            raise FileNotFoundError(f"No members found in {path}.")
+
+        self.hyperparameters = {}
+        if exists(join(path, 'hyperparameters.json')):
+            with open(join(path, 'hyperparameters.json')) as file:
+                self.hyperparameters = json.load(file)
+        self.hyperparameters['n_members'] = len(files)
+
+        if exists(join(path, 'threading.json')):
+            with open(join(path, 'threading.json')) as file:
+                self.threading = json.load(file)
+
+        self.member_segments = None
+        if exists(join(path, 'member_segments.npy')):
+            self.member_segments = np.load(join(path, 'member_segments.npy'))
+
+        self.ensemble = [load_model(file, compile=False) for file in files]
+        self.history = [None] * len(self.ensemble)
+        self._loaded()
+
+    def _loaded(self):
+        """
+        Called after an ensemble was loaded, e.g. to set attributes which
+        depend on the architecture of the members.
+        """
+        pass
+
+
+class baseModel(ensembleTrainer):
     """
     The class from which each new model should inherit. Because of the
     inheritance, standardized training and testing will be possible.
@@ -10,11 +543,23 @@ class baseModel(object):
     Errors will be raised if mandotory functions are not overwritten
     by the child model. Mandetory functions are:
 
-        1. fit
+        1. fit (usually a call of .fit_ensemble())
         2. predict
-        3. save
-        4. load
+
+    The training of the members as well as save and load are provided by the
+    ensembleTrainer.
     """
+    # attributes besides the constructor arguments that a worker of a parallel
+    # search needs (see ._worker_spec())
+    _worker_attributes = ['pretrained_weights']
+
+    def __new__(cls, *args, **kwargs):
+        # the constructor arguments are kept to rebuild the model in a worker
+        # process of a parallel search
+        self = super().__new__(cls)
+        self._init_args = (args, kwargs)
+        return self
+
     def __init__(self):
         raise NameError("Function '__init__' is not defined")
 
@@ -38,18 +583,138 @@ class baseModel(object):
                     self.hyperparameters_search[key] = self.hyperparameters[key].copy()
 
 
-    def fit_RandomizedSearch(self, trainX, trainy, timey, n_iter=10, **kwargs):
+    def numpy_mixture(self):
+        """
+        The description of the ensemble mixture for the NumPy inference
+        backend (see ninolearn.learn.inference). The default is the mean of
+        the members.
+        """
+        return {'type': 'mean'}
+
+    def _sample_hyperparameters(self):
+        """
+        Returns a copy of the hyperparameters in which the hyperparameters
+        that are searched are randomly drawn from their search space.
+        """
+        hyperparameters = self.hyperparameters.copy()
+
+        for key in self.hyperparameters_search.keys():
+            search_type = self.hyperparameters_search[key][2]
+            if search_type=='linear':
+                low = self.hyperparameters_search[key][0]
+                high = self.hyperparameters_search[key][1]
+
+                if type(low) is float or type(high) is float:
+                    hyperparameters[key] = np.random.uniform(low, high)
+
+                elif type(low) is int and type(high) is int:
+                    hyperparameters[key] = np.random.randint(low, high+1)
+
+                elif type(low) is tuple and type(high) is tuple:
+                    hyp_list = []
+                    for j in range(len(low)):
+                        hyp_list.append(np.random.randint(low[j], high[j]+1))
+                    hyperparameters[key] = tuple(hyp_list)
+
+            elif search_type=='log':
+                low = self.hyperparameters_search[key][0]
+                high = self.hyperparameters_search[key][1]
+
+                choice_values = np.logspace(np.log10(low), np.log10(high), 100)
+                hyperparameters[key] = np.random.choice(choice_values)
+
+            elif search_type=='exp':
+                 base = self.hyperparameters_search[key][0]
+                 low_exp = self.hyperparameters_search[key][1][0]
+                 high_exp = self.hyperparameters_search[key][1][1]
+
+                 exponents = np.arange(low_exp, high_exp+1)
+                 choice_values = base**exponents
+
+                 hyperparameters[key] = np.random.choice(choice_values)
+
+        return hyperparameters
+
+    def _ensemble_state(self):
+        """
+        Returns the trained ensemble as plain (picklable) numpy weights
+        together with the hyperparameters and the validation losses.
+        """
+        return {'hyperparameters': self.hyperparameters.copy(),
+                'weights': [member.get_weights() for member in self.ensemble],
+                'val_loss': list(self.val_loss),
+                'member_segments': self.member_segments,
+                'threading': self.threading}
+
+    def _restore_ensemble(self, state, n_features):
+        """
+        Rebuild the ensemble from a state returned by ._ensemble_state().
+        """
+        self.hyperparameters = state['hyperparameters'].copy()
+        _clear_session(len(state['weights']))
+
+        self.ensemble = []
+        for weights in state['weights']:
+            member = self.build_model(n_features)
+            member.set_weights(weights)
+            self.ensemble.append(member)
+
+        self.val_loss = state['val_loss']
+        self.mean_val_loss = np.mean(self.val_loss)
+        self.member_segments = state['member_segments']
+        self.history = [None] * len(self.ensemble)
+        self.threading = state['threading']
+
+    def fit_RandomizedSearch(self, trainX, trainy, timey, n_iter=10, n_jobs=1,
+                             refit=False, search='random', eta=3, trials=None,
+                             n_warm_start=3, **kwargs):
         """
         This method performs a random search in the hyperparamter space.
+        The ensemble of the best hyperparameters is kept, hence no refitting
+        is needed at the end of the search.
 
         :param trainX: The feature set.
 
         :param trainy: The label set.
 
-        :param n_iter: The number of iterations for the random search.
+        :param n_iter: The number of iterations for the random search. For\
+        search='halving' this is the number of configurations that are\
+        evaluated on the smallest budget.
+
+        :type n_jobs: int
+        :param n_jobs: The number of worker processes that train the\
+        candidate configurations in parallel (-1 for all cores). For n_jobs=1\
+        the candidates are trained one after another in this process. The\
+        workers are spawned, see ._search_parallel().
+
+        :type refit: bool
+        :param refit: Refit the model with the best hyperparameters at the\
+        end of the search instead of keeping the best ensemble.
+
+        :type search: str
+        :param search: Either 'random' (each candidate is trained with the\
+        full budget) or 'halving' (successive halving, see\
+        ._successive_halving()).
+
+        :type eta: int
+        :param eta: The reduction factor of the successive halving. Only the\
+        best 1/eta of the candidates are promoted to the next rung which has\
+        an eta times larger budget.
+
+        :type trials: ninolearn.learn.trials.trialStore
+        :param trials: A persistent store of the trials. If provided, the\
+        search starts with the best configurations of the previous trials\
+        (on the most recent previous data version), skips configurations that were already evaluated on identical data\
+        and records the new trials.
+
+        :type n_warm_start: int
+        :param n_warm_start: The number of best previous configurations the\
+        search starts with.
 
         :param kwargs: Keyword arguments that are passed to the fit method.
         """
+        if search not in ['random', 'halving']:
+            raise ValueError("The search must be either 'random' or 'halving'.")
 
         self.history_hyp = defaultdict(list)
 
@@ -57,90 +722,307 @@ class baseModel(object):
         if len(self.hyperparameters_search) == 0:
             print("WARNING: No variable indicated for hyperparameter search!")
 
-        #iterate with randomized hyperparameters
-        best_loss = np.inf
-        for i in range(n_iter):
-            print(f"Search iteration Nr {i+1}/{n_iter}")
+        if trials is None:
+            candidates = [self._sample_hyperparameters() for i in range(n_iter)]
+        else:
+            if trials.data_version is None:
+                trials.data_version = data_version(trainX, trainy)
+            candidates = self._trial_candidates(trials, n_iter, n_warm_start)
 
-            # random selection of hyperparameters
-            for key in self.hyperparameters_search.keys():
-                search_type = self.hyperparameters_search[key][2]
-                if search_type=='linear':
-                    low = self.hyperparameters_search[key][0]
-                    high = self.hyperparameters_search[key][1]
+        if len(candidates) == 0:
+            best_state, last_state = None, None
 
-                    if type(low) is float or type(high) is float:
-                        self.hyperparameters[key] = np.random.uniform(low, high)
+        elif search == 'random':
+            best_state, last_state = None, None
+            for i, state in enumerate(self._evaluate_candidates(candidates, n_jobs,
+                                                                trainX, trainy, timey,
+                                                                trials=trials,
+                                                                **kwargs)):
+                print(f"Search iteration Nr {i+1}/{len(candidates)}")
+                last_state = state
 
-                    elif type(low) is int and type(high) is int:
-                        self.hyperparameters[key] = np.random.randint(low, high+1)
+                # check if validation score was enhanced
+                if best_state is None or np.mean(state['val_loss']) < np.mean(best_state['val_loss']):
+                    best_state = state
+                    self._print_best(best_state)
 
-                    elif type(low) is tuple and type(high) is tuple:
-                        hyp_list = []
-                        for i in range(len(low)):
-                            hyp_list.append(np.random.randint(low[i], high[i]+1))
-                        self.hyperparameters[key] = tuple(hyp_list)
+        elif search == 'halving':
+            best_state, last_state = self._successive_halving(candidates, eta, n_jobs,
+                                                              trainX, trainy, timey,
+                                                              trials=trials,
+                                                              **kwargs)
 
-                elif search_type=='log':
-                    low = self.hyperparameters_search[key][0]
-                    high = self.hyperparameters_search[key][1]
+        if trials is not None:
+            best_state, last_state = self._best_previous_trial(trials, best_state, last_state,
+                                                               trainX, trainy, timey,
+                                                               **kwargs)
 
-                    choice_values = np.logspace(np.log10(low), np.log10(high), 100)
-                    self.hyperparameters[key] = np.random.choice(choice_values)
+        best_loss = np.mean(best_state['val_loss'])
+        self.best_hyperparameters = best_state['hyperparameters'].copy()
 
-                elif search_type=='exp':
-                     base = self.hyperparameters_search[key][0]
-                     low_exp = self.hyperparameters_search[key][1][0]
-                     high_exp = self.hyperparameters_search[key][1][1]
+        if refit and n_iter!=1:
+            # refit the model with optimized hyperparameter
+            print("Refit the model with best hyperparamters")
 
-                     exponents = np.arange(low_exp, high_exp+1)
-                     choice_values = base**exponents
+            self.hyperparameters = self.best_hyperparameters.copy()
+            print(self.hyperparameters)
+            self.fit(trainX, trainy, timey=timey, **kwargs)
+
+            print(f"best loss search: {best_loss}")
+            print(f"loss refitting : {self.mean_val_loss}")
+        elif n_jobs != 1 or best_state is not last_state:
+            # keep the ensemble of the best hyperparameters
+            self._restore_ensemble(best_state, trainX.shape[1])
 
-                     self.hyperparameters[key] = np.random.choice(choice_values)
+    def _print_best(self, state):
+        print("New best hyperparameters")
+        print(f"Mean loss: {np.mean(state['val_loss'])}")
+        print(state['hyperparameters'])
 
+    def _evaluate_candidates(self, candidates, n_jobs, trainX, trainy, timey,
+                             rung=None, full_budget=True, trials=None, **kwargs):
+        """
+        Train the candidates, record them in the search history (and in the
+        trial store if they were trained with the full budget) and yield
+        their states in the order of the candidates.
+        """
+        if n_jobs == 1:
+            states = self._search_sequential(candidates, trainX, trainy, timey, **kwargs)
+        else:
+            states = self._search_parallel(candidates, n_jobs, trainX, trainy, timey, **kwargs)
 
-            self.fit(trainX, trainy, timey, **kwargs)
-            self.history_hyp['loss'].append(self.mean_val_loss)
+        for state in states:
+            self.history_hyp['loss'].append(np.mean(state['val_loss']))
             for key in self.hyperparameters_search.keys():
-                self.history_hyp[key].append(self.hyperparameters[key])
+                self.history_hyp[key].append(state['hyperparameters'][key])
+
+            # the budget of the rung gets its own columns because epochs and
+            # n_members_segment may be searched as well
+            if rung is not None:
+                self.history_hyp['rung'].append(rung)
+                for key in ['epochs', 'n_members_segment']:
+                    self.history_hyp[f'rung_{key}'].append(state['hyperparameters'][key])
 
             self.df_history_hyp = pd.DataFrame(dict(self.history_hyp))
-            #self.df_history_hyp.to_csv('hyperparameter_history.csv')
 
-            # check if validation score was enhanced
-            if self.mean_val_loss<best_loss:
-                best_loss = self.mean_val_loss
-                self.best_hyperparameters = self.hyperparameters.copy()
+            if trials is not None and full_budget:
+                trials.record(state['hyperparameters'], self._trial_keys(),
+                              np.mean(state['val_loss']))
+            yield state
 
-                print("New best hyperparameters")
-                print(f"Mean loss: {best_loss}")
-                print(self.best_hyperparameters)
+    def _trial_keys(self):
+        """
+        The keys of the hyperparameters that define a configuration in the
+        trial store.
+        """
+        return [key for key in self.hyperparameters.keys()
+                if key not in ['verbose', 'n_members']]
 
-        # refit the model with optimized hyperparameter
-        # AND to have the weights of the DE for the best hyperparameters again
-        if n_iter!=1:
-            print("Refit the model with best hyperparamters")
+    def _from_config(self, config, searched_only=True):
+        """
+        Returns hyperparameters from a configuration of the trial store.
 
-            self.hyperparameters = self.best_hyperparameters.copy()
-            print(self.hyperparameters)
-            self.fit(trainX, trainy, timey, **kwargs)
+        :param searched_only: Only take the values of the searched\
+        hyperparameters from the configuration. The other hyperparameters\
+        keep their current values.
+        """
+        hyperparameters = self._sample_hyperparameters()
+        for key, value in config.items():
+            if key not in hyperparameters:
+                continue
+            if searched_only and key not in self.hyperparameters_search:
+                continue
 
-            print(f"best loss search: {best_loss}")
-            print(f"loss refitting : {self.mean_val_loss}")
+            # tuples are saved as lists
+            if type(value) is list:
+                value = tuple(value)
+            hyperparameters[key] = value
+        return hyperparameters
 
+    def _trial_candidates(self, trials, n_iter, n_warm_start):
+        """
+        The candidates of a search with a trial store. The search starts with
+        the best previous configurations. The remaining candidates are drawn
+        randomly. Configurations that were already evaluated on identical data
+        are skipped.
+        """
+        keys = self._trial_keys()
+        candidates, configs = [], set()
 
-    def fit(self):
-        raise NameError("Function 'fit' is not defined!")
+        def add(hyperparameters):
+            config = config_string(hyperparameters, keys)
+            if config not in configs and not trials.evaluated(hyperparameters, keys):
+                candidates.append(hyperparameters)
+                configs.add(config)
+                return True
+            return False
 
+        # the best configurations on the most recent previous data version (the
+        # ones on the current data version were already evaluated)
+        n_warm = 0
+        previous_version = trials.previous_version()
+        if len(self.hyperparameters_search) > 0 and previous_version is not None:
+            for config, _ in trials.best(n_warm_start, data_version=previous_version):
+                if len(candidates) < n_iter:
+                    n_warm += add(self._from_config(config))
 
-    def predict(self):
-        raise NameError("Function 'fit' is not defined!")
+        # give up if the search space is exhausted
+        attempts = 0
+        while len(candidates) < n_iter and attempts < 100 * n_iter:
+            add(self._sample_hyperparameters())
+            attempts += 1
+
+        print(f"Search with {len(candidates)} new configurations "
+              f"({n_warm} from previous trials)")
+        return candidates
+
+    def _best_previous_trial(self, trials, best_state, last_state, trainX,
+                             trainy, timey, **kwargs):
+        """
+        If a configuration that was evaluated on identical data in a previous
+        search is better than the best one of this search, it is refitted.
+        If no configuration was trained in this search (all were evaluated
+        before), the best previous configuration is refitted, in case there
+        is none on identical data the best one on the most recent previous
+        data version.
+        """
+        previous = trials.best(1)
+        if len(previous) == 0 and best_state is None:
+            previous_version = trials.previous_version()
+            if previous_version is not None:
+                previous = trials.best(1, data_version=previous_version)
+            if len(previous) == 0:
+                raise ValueError("No configuration was trained and the trial store has no previous trial to refit.")
+        if len(previous) == 0:
+            return best_state, last_state
+
+        config, loss = previous[0]
+        if best_state is not None and not loss < np.mean(best_state['val_loss']):
+            return best_state, last_state
+
+        print("Refit the best configuration of the previous trials")
+        self.hyperparameters = self._from_config(config, searched_only=False)
+        self.fit(trainX, trainy, timey=timey, **kwargs)
+        state = self._ensemble_state()
+        self._print_best(state)
+        return state, state
+
+    def _successive_halving(self, candidates, eta, n_jobs, trainX, trainy,
+                            timey, trials=None, **kwargs):
+        """
+        Successive halving of the candidates. On the first rung all candidates
+        are trained with a reduced budget, i.e. with fewer members per segment
+        and fewer epochs. After each rung only the best 1/eta of the
+        candidates are promoted and the budget is increased by the factor eta.
+        The last rung uses the full budget of the hyperparameters.
+
+        :returns: The state of the best candidate on the last rung and the\
+        state that was trained last.
+        """
+        n_rungs = int(np.floor(np.log(len(candidates)) / np.log(eta) + 1e-9)) + 1
+
+        for rung in range(n_rungs):
+            fraction = float(eta) ** (rung - n_rungs + 1)
+
+            rung_candidates = []
+            for hyperparameters in candidates:
+                hyperparameters = hyperparameters.copy()
+                for key in ['epochs', 'n_members_segment']:
+                    hyperparameters[key] = max(1, int(np.ceil(hyperparameters[key] * fraction)))
+                rung_candidates.append(hyperparameters)
+
+            print(f"Rung {rung+1}/{n_rungs}: {len(candidates)} candidates, "
+                  f"{rung_candidates[0]['n_members_segment']} member(s) per segment, "
+                  f"max. {rung_candidates[0]['epochs']} epochs")
+
+            losses = []
+            best_state = None
+            for i, state in enumerate(self._evaluate_candidates(rung_candidates, n_jobs,
+                                                                trainX, trainy, timey,
+                                                                rung=rung,
+                                                                full_budget=rung == n_rungs - 1,
+                                                                trials=trials,
+                                                                **kwargs)):
+                print(f"Search iteration Nr {i+1}/{len(rung_candidates)} (rung {rung+1})")
+                losses.append(np.mean(state['val_loss']))
+
+                # only the states of the last rung are trained with the full budget
+                if rung == n_rungs - 1 and (best_state is None or losses[-1] < np.mean(best_state['val_loss'])):
+                    best_state = state
+                    self._print_best(best_state)
 
+            n_promote = max(1, int(np.ceil(len(candidates) / eta)))
+            promoted = np.argsort(losses, kind='stable')[:n_promote]
+            candidates = [candidates[i] for i in promoted]
 
-    def save(self):
-        raise NameError("Function 'save' is not defined!")
+        return best_state, state
 
+    def _search_sequential(self, candidates, trainX, trainy, timey, **kwargs):
+        """
+        Train the candidates one after another and yield their states.
+        """
+        for hyperparameters in candidates:
+            self.hyperparameters = hyperparameters
+            self.fit(trainX, trainy, timey=timey, **kwargs)
+            yield self._ensemble_state()
+
+    def _worker_spec(self):
+        """
+        The specification from which a worker process rebuilds the model: the
+        module and the name of the class, the constructor arguments and the
+        attributes in _worker_attributes.
+        """
+        attributes = {key: getattr(self, key) for key in self._worker_attributes
+                      if hasattr(self, key)}
+        return (type(self).__module__, type(self).__name__, self._init_args,
+                attributes)
+
+    def _search_parallel(self, candidates, n_jobs, trainX, trainy, timey, **kwargs):
+        """
+        Train the candidates in spawned worker processes and yield their
+        states in the order of the candidates.
 
-    def load(self):
-        raise NameError("Function 'load' is not defined!")
+        The workers are spawned (not forked) because this process may already
+        have initialized TensorFlow whose thread pools do not survive a fork.
+        The model and the data are passed to the workers explicitly. Hence, a
+        script that runs a parallel search must be guarded by\
+        if __name__ == "__main__".
+        """
+        if n_jobs == -1:
+            n_jobs = cpu_count()
+        n_workers = min(n_jobs, len(candidates))
+
+        seeds = np.random.randint(0, 2**31 - 1, size=len(candidates))
+        spec = self._worker_spec()
+        tasks = [(spec, hyperparameters, seed, trainX, trainy, timey, kwargs)
+                 for hyperparameters, seed in zip(candidates, seeds)]
+
+        # each worker takes one slot and is pinned to the cores of its slot
+        # (see ninolearn.config.worker_cores)
+        ctx = multiprocessing.get_context('spawn')
+        slots = ctx.Queue()
+        for slot in range(n_workers):
+            slots.put(slot)
+
+        # the workers import the main script before the initializer runs,
+        # hence they get the thread settings from the environment
+        with config.worker_environment(n_workers):
+            with ctx.Pool(n_workers, initializer=_init_worker,
+                          initargs=(slots, n_workers, config.settings)) as pool:
+                for state in pool.imap(_fit_candidate, tasks):
+                    yield state
+
+
+    def fit(self):
+        raise NameError("Function 'fit' is not defined!")
+
+    def load(self, location=None, dir_name='dem'):
+        """
+        Load the ensemble (see ensembleTrainer.load).
+        """
+        super().load(location=location, dir_name=dir_name)
+
+
+    def predict(self):
+        raise NameError("Function 'predict' is not defined!")
 
@@ -1,28 +1,14 @@
 import numpy as np
 
-import tensorflow.keras.backend as K
-from tensorflow.keras.activations import elu
-from tensorflow.keras.models import Model, save_model, load_model
+from tensorflow.keras.models import Model
 from tensorflow.keras.layers import Dense, Input, concatenate
 from tensorflow.keras.layers import Dropout, GaussianNoise
-from tensorflow.keras.optimizers import Adam, RMSprop
-from tensorflow.keras.callbacks import EarlyStopping
 from tensorflow.keras import regularizers
 
-from os.path import join, exists
-from os import mkdir, listdir, getcwd
-from shutil import rmtree
-import glob
-
 from ninolearn.learn.models.baseModel import baseModel
 from ninolearn.learn.losses import nll_gaussian, nll_skewed_gaussian
+from ninolearn.learn.mixture import from_predictions
 from ninolearn.learn.skillMeasures import rmse
-from ninolearn.utils import small_print_header
-from ninolearn.exceptions import MissingArgumentError
-
-import warnings
-
-import time
 
 class DEM(baseModel):
     """
@@ -85,11 +71,20 @@ class DEM(baseModel):
     :param pdf: The distribution which shell be predicted. Either 'simple'\
     (just one value), 'normal' (Gaussian) or 'skewed' (skewed Gaussian).
 
+    :type engine: str
+    :param engine: The training engine. Either 'keras' (Keras fit method\
+    with an EarlyStopping callback) or 'compiled' (the data is kept as\
+    tensors and the epoch loop runs in a compiled tf.function).
+
+    :type check_every: int
+    :param check_every: For engine='compiled', the number of epochs between\
+    two checks of the early stopping criterion.
+
     :type name: str
     :param name: The name of the model.
     """
-    def __del__(self):
-        K.clear_session()
+    # number of lead times that are predicted by each output head
+    n_heads = 1
 
     def __init__(self, layers=1, neurons=16, dropout=0.2, noise_in=0.0,
                        noise_mu=0.0, noise_sigma=0.0, noise_alpha=0.0,
@@ -99,7 +94,7 @@ class DEM(baseModel):
                        l1_alpha=0.0, l2_alpha=0.0,
                        batch_size=10, n_segments=5, n_members_segment=1,
                        lr=0.001, patience = 10, epochs=100, verbose=0, pdf='normal',
-                       activation='relu',
+                       activation='relu', engine='keras', check_every=10,
                        name='dem'):
 
         self.set_hyperparameters(layers=layers, neurons=neurons, dropout=dropout,
@@ -110,7 +105,8 @@ class DEM(baseModel):
                                  l1_alpha=l1_alpha, l2_alpha=l2_alpha,
                                  batch_size=batch_size, n_segments=n_segments, n_members_segment=n_members_segment,
                                  lr=lr, patience=patience, epochs=epochs, verbose=verbose, pdf=pdf,
-                                 activation=activation,
+                                 activation=activation, engine=engine,
+                                 check_every=check_every,
                                  name=name)
         self.get_model_desc(self.hyperparameters['pdf'])
 
@@ -137,20 +133,21 @@ class DEM(baseModel):
             self.n_outputs = 1
             self.output_names =  ['mean']
 
+    def numpy_mixture(self):
+        """
+        The description of the ensemble mixture for the NumPy inference
+        backend.
+        """
+        if self.hyperparameters['pdf'] == 'normal':
+            return {'type': 'gaussian'}
+        elif self.hyperparameters['pdf'] == 'skewed':
+            return {'type': 'skewed'}
+        return {'type': 'mean'}
+
     def build_model(self, n_features):
         """
         The method builds a new member of the ensemble and returns it.
         """
-        # derived parameters
-        self.hyperparameters['n_members'] = self.hyperparameters['n_segments'] * self.hyperparameters['n_members_segment']
-
-        # initialize optimizer and early stopping
-        self.optimizer =  Adam(lr=self.hyperparameters['lr'], beta_1=0.9, beta_2=0.999, epsilon=None, decay=0., amsgrad=False)
-
-
-        self.es = EarlyStopping(monitor=f'val_{self.loss_name}', min_delta=0.0, patience=self.hyperparameters['patience'], verbose=1,
-                   mode='min', restore_best_weights=True)
-
         inputs = Input(shape=(n_features,))
         h = GaussianNoise(self.hyperparameters['noise_in'],
                           name='noise_input')(inputs)
@@ -166,7 +163,7 @@ class DEM(baseModel):
             h = Dropout(self.hyperparameters['dropout'],
                         name=f'hidden_dropout_{i}')(h)
 
-        mu = Dense(1, activation='linear',
+        mu = Dense(self.n_heads, activation='linear',
                    kernel_regularizer=regularizers.l1_l2(self.hyperparameters['l1_mu'],
                                                          self.hyperparameters['l2_mu']),
                    kernel_initializer='random_uniform',
@@ -178,7 +175,7 @@ class DEM(baseModel):
 
 
         if self.hyperparameters['pdf']=='normal' or self.hyperparameters['pdf']=='skewed':
-            sigma = Dense(1, activation='softplus',
+            sigma = Dense(self.n_heads, activation='softplus',
                           kernel_regularizer=regularizers.l1_l2(self.hyperparameters['l1_sigma'],
                                                                 self.hyperparameters['l2_sigma']),
                           kernel_initializer='random_uniform',
@@ -189,7 +186,7 @@ class DEM(baseModel):
                                   name='noise_sigma')(sigma)
 
         if self.hyperparameters['pdf']=='skewed':
-            alpha = Dense(1, activation='linear',
+            alpha = Dense(self.n_heads, activation='linear',
                        kernel_regularizer=regularizers.l1_l2(self.hyperparameters['l1_alpha'],
                                                              self.hyperparameters['l2_alpha']),
                        kernel_initializer='random_uniform',
@@ -210,109 +207,20 @@ class DEM(baseModel):
         return model
 
 
-    def fit(self, trainX, trainy, timey, valX=None, valy=None, use_pretrained=False):
+    def fit(self, trainX, trainy, timey, valX=None, valy=None, use_pretrained=False,
+            checkpoint=None):
         """
-        Fit the model to training data
+        Fit the model to training data (see ensembleTrainer.fit_ensemble).
         """
+        self.fit_ensemble(trainX, trainy, valX=valX, valy=valy,
+                          use_pretrained=use_pretrained, checkpoint=checkpoint)
 
-        start_time = time.time()
-        # clear memory
-        K.clear_session()
-
-        # allocate lists for the ensemble
-        self.ensemble = []
-        self.history = []
-        self.val_loss = []
-
-        self.segment_len = trainX.shape[0]//self.hyperparameters['n_segments']
-
-        if self.hyperparameters['n_segments']==1 and (valX is not None or valy is not None):
-             warnings.warn("Validation and test data set are the same if n_segements is 1!")
-
-        i = 0
-        while i<self.hyperparameters['n_members_segment']:
-            j = 0
-            while j<self.hyperparameters['n_segments']:
-                print("build")
-                ensemble_member = self.build_model(trainX.shape[1])
-
-                n_ens_sel = len(self.ensemble)
-                small_print_header(f"Train member Nr {n_ens_sel+1}/{self.hyperparameters['n_members']}")
-
-                if use_pretrained:
-                    ensemble_member.load_weights(self.pretrained_weights)
-
-                print("compile")
-                ensemble_member.compile(loss=self.loss, optimizer=self.optimizer, metrics=[self.loss])
-
-                # validate on the spare segment
-                if self.hyperparameters['n_segments']!=1:
-                    if valX is not None or valy is not None:
-                        warnings.warn("Validation data set will be one of the segments. The provided validation data set is not used!")
-
-                    start_ind = j * self.segment_len
-                    end_ind = (j+1) *  self.segment_len
-
-                    trainXens = np.delete(trainX, np.s_[start_ind:end_ind], axis=0)
-                    trainyens = np.delete(trainy, np.s_[start_ind:end_ind])
-
-                    # upsample el nino like periods
-                    if False:
-                        timeyens = np.delete(timey, np.s_[start_ind:end_ind])
-
-                        elninolike = (timeyens>=f'1982-01-01') & (timeyens<=f'2001-12-01')
-                        laninalike = np.invert(elninolike)
-
-
-                        trainXens_nino, trainyens_nino = trainXens[elninolike], trainyens[elninolike]
-                        trainXens_nina, trainyens_nina = trainXens[laninalike], trainyens[laninalike]
-
-                        nino_choices = np.random.choice(np.arange(len(trainyens_nino)), size=1000)
-                        nina_choices = np.random.choice(np.arange(len(trainyens_nina)), size=1000)
-
-
-                        trainXens = np.concatenate((trainXens_nino[nino_choices],
-                                                    trainXens_nina[nina_choices]))
-
-                        trainyens = np.concatenate((trainyens_nino[nino_choices],
-                                                    trainyens_nina[nina_choices]))
-
-
-                    valXens = trainX[start_ind:end_ind]
-                    valyens = trainy[start_ind:end_ind]
-
-                    if False:
-                        valXens, trainXens = trainXens, valXens
-                        valyens, trainyens = trainyens, valyens
-
-                # validate on test data set
-                elif self.hyperparameters['n_segments']==1:
-                    if valX is None or valy is None:
-                        raise MissingArgumentError("When segments length is 1, a validation data set must be provided.")
-                    trainXens = trainX
-                    trainyens = trainy
-                    valXens = valX
-                    valyens = valy
-
-                history = ensemble_member.fit(trainXens, trainyens,
-                                            epochs=self.hyperparameters['epochs'], batch_size=self.hyperparameters['batch_size'],
-                                            verbose=self.hyperparameters['verbose'],
-                                            shuffle=True, callbacks=[self.es],
-                                            validation_data=(valXens, valyens))
-
-                self.history.append(history)
-                self.val_loss.append(ensemble_member.evaluate(valXens, valyens)[1])
-                self.ensemble.append(ensemble_member)
-                j+=1
-            i+=1
-        self.mean_val_loss = np.mean(self.val_loss)
-
-        print(f'Loss: {self.mean_val_loss}')
-        # print computation time
-        end_time = time.time()
-        passed_time = np.round(end_time-start_time, decimals=1)
-        print(f'Computation time: {passed_time}s')
-#
+    def predict_members(self, X):
+        """
+        The predictions of all members with the shape\
+        (n_samples, n_outputs, n_members).
+        """
+        return np.stack([member.predict(X) for member in self.ensemble], axis=-1)
 
     def predict(self, X):
         """
@@ -322,39 +230,121 @@ class DEM(baseModel):
         :param X: The features
 
         """
-        if self.hyperparameters['pdf']=='normal':
-            pred_ens = np.zeros((X.shape[0], 2, self.hyperparameters['n_members']))
+        return self._mixture(self.predict_members(X))
 
-        elif self.hyperparameters['pdf']=='skewed':
-            pred_ens = np.zeros((X.shape[0], 3, self.hyperparameters['n_members']))
+    def predict_mixture(self, X):
+        """
+        Returns the predicted mixture distribution (see\
+        ninolearn.learn.mixture) which provides e.g. quantiles and the CDF.
+        Not available for pdf=None.
+        """
+        return from_predictions(self.predict_members(X),
+                                self.numpy_mixture()['type'])
 
-        elif self.hyperparameters['pdf'] is None:
-            pred_ens = np.zeros((X.shape[0], 1, self.hyperparameters['n_members']))
+    def prune(self, X, y, tol=0.01, held_out=True):
+        """
+        Greedy backward selection of the ensemble members. Starting from the
+        full ensemble, the member whose removal increases the negative-log-
+        likelihood (NLL) of the mixture the least is removed as long as the NLL
+        stays within *tol* of the NLL of the full ensemble. The pruned
+        ensemble is kept (and saved by .save()).
+
+        :param X: The features. For held_out=True the training features that\
+        were passed to .fit().
+
+        :param y: The labels.
+
+        :type tol: float
+        :param tol: The tolerated increase of the NLL.
 
-        for i in range(self.hyperparameters['n_members']):
-            pred_ens[:,:,i] = self.ensemble[i].predict(X)
-        return self._mixture(pred_ens)
+        :type held_out: bool
+        :param held_out: If True, each member is only evaluated on the segment\
+        that it was validated on during the training, hence the NLL is\
+        computed on held-out data only and each segment keeps at least one\
+        member. If False, X and y are an independent validation data set on\
+        which all members are evaluated.
 
+        :returns: The NLL of the full and of the pruned ensemble.
+        """
+        if self.hyperparameters['pdf'] is None:
+            raise ValueError("Pruning needs a predicted distribution (pdf='normal' or 'skewed').")
+
+        kind = self.numpy_mixture()['type']
+        n_members = len(self.ensemble)
+        pred = self.predict_members(X)
+
+        if held_out:
+            n_segments = self.hyperparameters.get('n_segments', 1)
+            if n_segments == 1:
+                raise ValueError("Held-out pruning needs n_segments > 1. Use held_out=False with a validation data set.")
+
+            segment_len = X.shape[0]//n_segments
+            segments = self.member_segments
+            if segments is None or len(segments) != n_members:
+                # member i*n_segments + j was validated on segment j
+                segments = np.arange(n_members) % n_segments
+        else:
+            n_segments, segment_len = 1, X.shape[0]
+            segments = np.zeros(n_members, dtype=int)
+
+        def nll(keep):
+            summed, count = 0., 0
+            for j in range(n_segments):
+                sl = np.s_[j*segment_len:(j+1)*segment_len]
+                mixture = from_predictions(pred[sl][..., keep & (segments==j)], kind)
+                yj = np.reshape(y[sl], mixture.mean().shape)
+                n = np.sum(np.isfinite(yj))
+                summed += n * mixture.nll(yj)
+                count += n
+            return summed / count
+
+        keep = np.ones(n_members, dtype=bool)
+        nll_full = nll_pruned = nll(keep)
+
+        while keep.sum() > 1:
+            candidates = [k for k in np.flatnonzero(keep)
+                          if np.sum(keep & (segments==segments[k])) > 1]
+            if len(candidates) == 0:
+                break
+
+            losses = []
+            for k in candidates:
+                trial = keep.copy()
+                trial[k] = False
+                losses.append(nll(trial))
+
+            best = int(np.argmin(losses))
+            if losses[best] > nll_full + tol:
+                break
+            keep[candidates[best]] = False
+            nll_pruned = losses[best]
+
+        self.ensemble = [member for member, k in zip(self.ensemble, keep) if k]
+        if len(getattr(self, 'val_loss', [])) == n_members:
+            self.val_loss = [loss for loss, k in zip(self.val_loss, keep) if k]
+            self.history = [hist for hist, k in zip(self.history, keep) if k]
+            self.mean_val_loss = np.mean(self.val_loss)
+        self.member_segments = segments[keep] if held_out else None
+        self.hyperparameters['n_members'] = len(self.ensemble)
+
+        print(f'Pruned ensemble: {len(self.ensemble)}/{n_members} members')
+        print(f'NLL: {nll_full:.4f} (full), {nll_pruned:.4f} (pruned)')
+        return nll_full, nll_pruned
 
     def _mixture(self, pred):
         """
         returns the ensemble mixture results
         """
-        mix_mean = pred[:,0,:].mean(axis=1)
-
         if self.hyperparameters['pdf']=='normal':
-            mix_var = np.mean(pred[:,0,:]**2 + pred[:,1,:]**2, axis=1)  - mix_mean**2
-            mix_std = np.sqrt(mix_var)
-            return [mix_mean, mix_std]
+            mixture = from_predictions(pred, 'gaussian')
+            return [mixture.mean(), mixture.std()]
 
         elif self.hyperparameters['pdf']=='skewed':
-            mix_var = np.mean(pred[:,0,:]**2 + pred[:,1,:]**2, axis=1)  - mix_mean**2
-            mix_std = np.sqrt(mix_var)
-            print("Mixture prediction for skewed distribution is not ready!")
-            return mix_mean, mix_std, None
+            mixture = from_predictions(pred, 'skewed')
+            return mixture.mean(), mixture.std(), mixture.skewness()
 
         elif self.hyperparameters['pdf'] is None:
-            return mix_mean
+            return pred[:,0,:].mean(axis=1)
 
 
     def evaluate(self, ytrue, mean_pred, std_pred=False):
@@ -376,42 +366,12 @@ class DEM(baseModel):
             return loss
 
 
-    def save(self, location='', dir_name='ensemble'):
-        """
-        Save the ensemble
-        """
-        path = join(location, dir_name)
-        if not exists(path):
-            mkdir(path)
-        else:
-            rmtree(path)
-            mkdir(path)
-
-        self.df_history_hyp.to_csv(join(path, 'hyperparameters_history.csv'))
-
-        for i in range(self.hyperparameters['n_members']):
-            path_h5 = join(path, f"member{i}.h5")
-            save_model(self.ensemble[i], path_h5, include_optimizer=False)
-
-
-    def load(self, location=None,  dir_name='dem'):
+    def _loaded(self):
         """
-        Load the ensemble
+        Derive the predicted distribution from the number of outputs of the
+        loaded members.
         """
-        if location is None:
-            location = getcwd()
-
-        path = join(location, dir_name, '*.h5')
-        files = glob.glob(path)
-        self.hyperparameters = {}
-        self.hyperparameters['n_members'] = len(files)
-        self.ensemble = []
-
-        for file in files:
-            file_path = join(path, file)
-            self.ensemble.append(load_model(file_path, compile=False))
-
-        output_neurons = self.ensemble[0].get_output_shape_at(0)[1]
+        output_neurons = self.ensemble[0].output_shape[-1]
 
         if output_neurons==2:
             self.hyperparameters['pdf'] = 'normal'
@@ -422,5 +382,3 @@ class DEM(baseModel):
             self.hyperparameters['pdf'] = None
 
         self.get_model_desc(self.hyperparameters['pdf'])
-
-
@@ -1,26 +1,16 @@
 import numpy as np
 
-import tensorflow.keras.backend as K
-from tensorflow.keras.models import Model, save_model, load_model
+from tensorflow.keras.models import Model
 from tensorflow.keras.layers import Dense, Input, Dropout
 from tensorflow.keras.layers import GaussianNoise
-from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.callbacks import EarlyStopping
 from tensorflow.keras import regularizers
 
-from os.path import join, exists
-from os import mkdir, listdir, getcwd
-from shutil import rmtree
-
-
+from ninolearn.learn.models.baseModel import ensembleTrainer
 from ninolearn.learn.skillMeasures import rmse
-from ninolearn.exceptions import MissingArgumentError
 from ninolearn.utils import small_print_header, print_header
 
 
-import warnings
-
-class EncoderDecoder(object):
+class EncoderDecoder(ensembleTrainer):
     """
     The Encoder-Decoder is an neural network that has the same architecture as
     an Autoencoder. Hence, labal and feature vector have the same dimension.
@@ -32,7 +22,8 @@ class EncoderDecoder(object):
                        noise_out=0.2, l1_hidden=0.0001, l2_hidden=0.0001,
                        l1_out=0.0001, l2_out=0.0001, batch_size=50,
                        lr=0.0001, n_segments=5, n_members_segment=1,
-                       patience = 40, epochs=500, verbose=0):
+                       patience = 40, epochs=500, verbose=0, engine='keras',
+                       check_every=10):
         """
         Set the parameters of the Encoder-Decoder neural network.
 
@@ -91,6 +82,14 @@ class EncoderDecoder(object):
         :type verbose: int
         :param verbose: Print some progress to screen. Either 0 (silent), 1 or\
         2.
+
+        :type engine: str
+        :param engine: The training engine of the members, either 'keras' or\
+        'compiled' (see ensembleTrainer.fit_member).
+
+        :type check_every: int
+        :param check_every: For engine='compiled', the number of epochs\
+        between two checks of the early stopping criterion.
         """
 
         # hyperparameters
@@ -123,6 +122,15 @@ class EncoderDecoder(object):
         # derived parameters
         self.n_members = self.n_segments * self.n_members_segment
 
+        # settings of the ensemble training
+        self.hyperparameters.update({'n_segments': n_segments,
+                                     'n_members_segment': n_members_segment,
+                                     'patience': patience, 'epochs': epochs,
+                                     'verbose': verbose, 'engine': engine,
+                                     'check_every': check_every})
+        self.loss = 'mse'
+        self.loss_name = 'mean_squared_error'
+
 
     def build_model(self, n_features, n_labels):
         """
@@ -134,12 +142,6 @@ class EncoderDecoder(object):
         :type n_labels: int
         :param n_labels: The number of labels.
         """
-
-        # initialize optimizer and early stopping
-        self.optimizer = Adam(lr=self.hyperparameters['lr'], beta_1=0.9, beta_2=0.999, epsilon=None, decay=0., amsgrad=False)
-        self.es = EarlyStopping(monitor=f'val_mean_squared_error', min_delta=0.0, patience=self.patience, verbose=1,
-                   mode='min', restore_best_weights=True)
-
         inputs = Input(shape=(n_features,))
         h = GaussianNoise(self.hyperparameters['noise'])(inputs)
 
@@ -177,7 +179,7 @@ class EncoderDecoder(object):
         return encoder_decoder, encoder, decoder
 
 
-    def fit(self, trainX, trainy, valX=None, valy=None):
+    def fit(self, trainX, trainy, valX=None, valy=None, checkpoint=None):
         """
         Fit the model. If n_segments is 1, then a validation data set needs to
         be supplied.
@@ -197,70 +199,20 @@ class EncoderDecoder(object):
         :type valy:  np.ndarray
         :param valy: The validation label set. 2-D array with dimensions\
         (timesteps, labels).
+
+        :type checkpoint: str
+        :param checkpoint: A checkpoint directory (see\
+        ensembleTrainer.fit_ensemble).
         """
+        self.fit_ensemble(trainX, trainy, valX=valX, valy=valy,
+                          checkpoint=checkpoint)
+        self.n_members = self.hyperparameters['n_members']
 
-        # clear memory
-        K.clear_session()
-
-        # allocate lists for the ensemble
-        self.ensemble = []
-        self.history = []
-        self.val_loss = []
-
-        self.segment_len = trainX.shape[0]//self.n_segments
-
-        if self.n_segments==1 and (valX is not None or valy is not None):
-             warnings.warn("Validation and test data set are the same if n_segements is 1!")
-
-        i = 0
-        while i<self.n_members_segment:
-            j = 0
-            while j<self.n_segments:
-                n_ens_sel = len(self.ensemble)
-                small_print_header(f"Train member Nr {n_ens_sel+1}/{self.n_members}")
-
-                # build model
-                member, member_encoder, member_decoder = self.build_model(trainX.shape[1], trainy.shape[1])
-
-                # compite model
-                member.compile(loss='mse', optimizer=self.optimizer, metrics=['mse'])
-
-                # validate on the spare segment
-                if self.n_segments!=1:
-                    if valX is not None or valy is not None:
-                        warnings.warn("Validation data set will be one of the segments. The provided validation data set is not used!")
-
-                    start_ind = j * self.segment_len
-                    end_ind = (j+1) *  self.segment_len
-
-                    trainXens = np.delete(trainX, np.s_[start_ind:end_ind], axis=0)
-                    trainyens = np.delete(trainy, np.s_[start_ind:end_ind], axis=0)
-                    valXens = trainX[start_ind:end_ind]
-                    valyens = trainy[start_ind:end_ind]
-
-                # validate on test data set
-                elif self.n_segments==1:
-                    if valX is None or valy is None:
-                        raise MissingArgumentError("When segments length is 1, a validation data set must be provided.")
-                    trainXens = trainX
-                    trainyens = trainy
-                    valXens = valX
-                    valyens = valy
-
-                history = member.fit(trainXens, trainyens,
-                                            epochs=self.epochs, batch_size=self.hyperparameters['batch_size'],
-                                            verbose=self.verbose,
-                                            shuffle=True, callbacks=[self.es],
-                                            validation_data=(valXens, valyens))
-
-                self.history.append(history)
-                self.val_loss.append(member.evaluate(valXens, valyens)[1])
-                print(f"Loss: {self.val_loss[-1]}")
-                self.ensemble.append(member)
-                j+=1
-            i+=1
-        self.mean_val_loss = np.mean(self.val_loss)
-        print(f"Mean loss: {self.mean_val_loss}")
+    def _build_member(self, trainX, trainy):
+        """
+        Returns the Encoder-Decoder of a new member.
+        """
+        return self.build_model(trainX.shape[1], trainy.shape[1])[0]
 
     def fit_RandomizedSearch(self, trainX, trainy,  n_iter=10, **kwargs):
         """
@@ -362,21 +314,11 @@ class EncoderDecoder(object):
         :param dir_name: The specific directory name in the base directory\
         were to save the ensemble.
         """
-        path = join(location, dir_name)
-        if not exists(path):
-            mkdir(path)
-        else:
-            rmtree(path)
-            mkdir(path)
-
-        for i in range(self.n_members):
-            path_h5 = join(path, f"member{i}.h5")
-            save_model(self.ensemble[i], path_h5, include_optimizer=False)
-
+        super().save(location=location, dir_name=dir_name)
 
     def load(self, location=None,  dir_name='ensemble'):
         """
-        Save the ensemble.
+        Load the ensemble.
 
         :type location: str
         :param location: Base directory where for all Encoder-Decoder\
@@ -386,21 +328,10 @@ class EncoderDecoder(object):
         :param dir_name: The specific directory name in the base directory\
         were to find the ensemble.
         """
-        if location is None:
-            location = getcwd()
-        path = join(location, dir_name)
-        files = listdir(path)
-        self.n_members = len(files)
-        self.ensemble = []
-
-        for file in files:
-            file_path = join(path, file)
-            self.ensemble.append(load_model(file_path))
-
-        output_neurons = self.ensemble[0].get_output_shape_at(0)[1]
-        if output_neurons==2:
-            self.std = True
-        else:
-            self.std = False
+        super().load(location=location, dir_name=dir_name)
 
+    def _loaded(self):
+        self.n_members = self.hyperparameters['n_members']
 
+        output_neurons = self.ensemble[0].output_shape[-1]
+        self.std = output_neurons == 2
@@ -2,43 +2,26 @@
 IPNN : Classification neural network
 """
 import numpy as np
-import json
 
-import tensorflow.keras.backend as K
-from tensorflow.keras.models import Model, save_model, load_model
+from tensorflow.keras.models import Model
 from tensorflow.keras.layers import Dense, Input
 from tensorflow.keras.layers import Dropout, GaussianNoise
 from tensorflow.keras.losses import sparse_categorical_crossentropy
-from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.callbacks import EarlyStopping
 from tensorflow.keras import regularizers
 
-from os.path import join, exists
-from os import mkdir, getcwd
-from shutil import rmtree
-import glob
-
 from ninolearn.learn.models.baseModel import baseModel
-from ninolearn.utils import small_print_header
-from ninolearn.exceptions import MissingArgumentError
-
-import warnings
-
-import time
 
 class ipnn(baseModel):
     """
 
     """
-    def __del__(self):
-        K.clear_session()
-
     def __init__(self, low=-5, high = +5, step=0.25, layers=1, neurons=16, dropout=0.2, noise_in=0.1,
                        noise_out=0.1,
                        l1_hidden=0.1, l2_hidden=0.1,
                        l1_out=0.0, l2_out=0.1,
                        batch_size=10, n_segments=5, n_members_segment=1,
                        lr=0.001, patience = 10, epochs=300, verbose=0,
+                       engine='keras', check_every=10,
                        name='ipnn'):
         self.set_hyperparameters(layers=layers, neurons=neurons, dropout=dropout,
                                  noise_in=noise_in, noise_out=noise_out,
@@ -47,6 +30,7 @@ class ipnn(baseModel):
 
                                  batch_size=batch_size, n_segments=n_segments, n_members_segment=n_members_segment,
                                  lr=lr, patience=patience, epochs=epochs, verbose=verbose,
+                                 engine=engine, check_every=check_every,
                                  name=name)
 
         self.loss = sparse_categorical_crossentropy
@@ -57,18 +41,17 @@ class ipnn(baseModel):
         self.output_names = [f'p{i}' for i in range(self.n_outputs)]
 
 
+    def numpy_mixture(self):
+        """
+        The description of the ensemble mixture for the NumPy inference
+        backend (mean of the members with the outputs as first axis).
+        """
+        return {'type': 'mean', 'transpose': True}
+
     def build_model(self, n_features):
         """
         The method builds a new member of the ensemble and returns it.
         """
-        # derived parameters
-        self.hyperparameters['n_members'] = self.hyperparameters['n_segments'] * self.hyperparameters['n_members_segment']
-
-        # initialize optimizer and early stopping
-        self.optimizer = Adam(lr=self.hyperparameters['lr'], beta_1=0.9, beta_2=0.999, epsilon=None, decay=0., amsgrad=False)
-        self.es = EarlyStopping(monitor=f'val_{self.loss_name}', min_delta=0.0, patience=self.hyperparameters['patience'], verbose=1,
-                   mode='min', restore_best_weights=True)
-
         inputs = Input(shape=(n_features,))
         h = GaussianNoise(self.hyperparameters['noise_in'],
                           name='noise_input')(inputs)
@@ -94,102 +77,79 @@ class ipnn(baseModel):
         model = Model(inputs=inputs, outputs=out)
         return model
 
-    def to_inteval(self, y):
-        y_cls = np.zeros(len(y))
-        y_cls[:] = -999
+    def to_inteval(self, y, one_hot=False, classes=False):
+        """
+        The interval class of the labels. Class i holds the labels in\
+        (thresholds[i-1], thresholds[i]], class 0 the labels up to the first\
+        and the last class the labels above the last threshold.
+
+        :param y: The labels.
 
-        for i in range(1, self.n_outputs-2):
-            y_cls[(self.thresholds[i]<y)&(self.thresholds[i+1]>=y)] = i
+        :type one_hot: bool
+        :param one_hot: Return the one-hot encoding with the shape\
+        (n_samples, n_outputs) instead of the class indices.
 
-        y_cls[self.thresholds[0]>y] = 0
-        y_cls[self.thresholds[-1]<y] = self.n_outputs - 1
-        return y_cls
+        :type classes: bool
+        :param classes: Return the class indices as integers. They are passed\
+        to .fit() as they are, e.g. to encode the labels only once for a\
+        random search.
+        """
+        y_cls = np.searchsorted(self.thresholds, np.asarray(y), side='left')
 
+        if one_hot:
+            return np.eye(self.n_outputs)[y_cls]
+        if classes:
+            return y_cls
+        return y_cls.astype(float)
 
-    def fit(self, trainX, trainy, valX=None, valy=None, use_pretrained=False):
+    def _class_labels(self, y):
         """
-        Fit the model to training data
+        The class indices of the labels which come either as values, as\
+        integer class indices or as one-hot encoding (see .to_inteval()).
+        The decoding of a one-hot encoding is kept for the same array, e.g.\
+        for the trials of a sequential search.
         """
-        trainy = self.to_inteval(trainy)
-        if valy is not None:
-            valy = self.to_inteval(valy)
+        if isinstance(y, np.ndarray) and y.ndim == 1 and np.issubdtype(y.dtype, np.integer):
+            return y
+
+        decoded = getattr(self, '_decoded_labels', None)
+        if decoded is not None and decoded[0] is y:
+            return decoded[1]
+
+        labels = np.asarray(y)
+        if labels.ndim == 2 and labels.shape[1] == self.n_outputs:
+            labels = labels.argmax(axis=1)
+            self._decoded_labels = (y, labels)
+            return labels
+        return self.to_inteval(labels, classes=True)
+
+    def fit(self, trainX, trainy, valX=None, valy=None, use_pretrained=False,
+            checkpoint=None, timey=None):
+        """
+        Fit the model to training data (see ensembleTrainer.fit_ensemble).
 
-        start_time = time.time()
-        # clear memory
-        K.clear_session()
+        :param trainy: The labels either as values, as integer class indices\
+        or as one-hot encoding (see .to_inteval()).
+        """
+        trainy = self._class_labels(trainy)
+        if valy is not None:
+            valy = self._class_labels(valy)
 
-        # allocate lists for the ensemble
-        self.ensemble = []
-        self.history = []
-        self.val_loss = []
         self.train_loss = []
+        self.fit_ensemble(trainX, trainy, valX=valX, valy=valy,
+                          use_pretrained=use_pretrained, checkpoint=checkpoint)
 
-        self.segment_len = trainX.shape[0]//self.hyperparameters['n_segments']
-
-        if self.hyperparameters['n_segments']==1 and (valX is not None or valy is not None):
-             warnings.warn("Validation and test data set are the same if n_segements is 1!")
-
-        i = 0
-        while i<self.hyperparameters['n_members_segment']:
-            j = 0
-            while j<self.hyperparameters['n_segments']:
-                ensemble_member = self.build_model(trainX.shape[1])
-
-                n_ens_sel = len(self.ensemble)
-                small_print_header(f"Train member Nr {n_ens_sel+1}/{self.hyperparameters['n_members']}")
-
-                if use_pretrained:
-                    ensemble_member.load_weights(self.pretrained_weights)
-
-                ensemble_member.compile(loss=self.loss, optimizer=self.optimizer, metrics=[self.loss])
-
-                # validate on the spare segment
-                if self.hyperparameters['n_segments']!=1:
-                    if valX is not None or valy is not None:
-                        warnings.warn("Validation data set will be one of the segments. The provided validation data set is not used!")
-
-                    start_ind = j * self.segment_len
-                    end_ind = (j+1) *  self.segment_len
-
-                    trainXens = np.delete(trainX, np.s_[start_ind:end_ind], axis=0)
-                    trainyens = np.delete(trainy, np.s_[start_ind:end_ind])
-                    valXens = trainX[start_ind:end_ind]
-                    valyens = trainy[start_ind:end_ind]
-
-                # validate on test data set
-                elif self.hyperparameters['n_segments']==1:
-                    if valX is None or valy is None:
-                        raise MissingArgumentError("When segments length is 1, a validation data set must be provided.")
-                    trainXens = trainX
-                    trainyens = trainy
-                    valXens = valX
-                    valyens = valy
-
-                history = ensemble_member.fit(trainXens, trainyens,
-                                            epochs=self.hyperparameters['epochs'],
-                                            batch_size=self.hyperparameters['batch_size'],
-                                            verbose=self.hyperparameters['verbose'],
-                                            shuffle=True, callbacks=[self.es],
-                                            validation_data=(valXens, valyens))
-
-                self.history.append(history)
-                self.val_loss.append(ensemble_member.evaluate(valXens, valyens)[1])
-
-                self.train_loss.append(ensemble_member.evaluate(trainXens, trainyens)[1])
-
-                self.ensemble.append(ensemble_member)
-                j+=1
-            i+=1
-        self.mean_val_loss = np.mean(self.val_loss)
         self.mean_train_loss = np.mean(self.train_loss)
-
-        print(f'Validation Loss: {self.mean_val_loss}')
         print(f'Train Loss: {self.mean_train_loss}')
-        # print computation time
-        end_time = time.time()
-        passed_time = np.round(end_time-start_time, decimals=1)
-        print(f'Computation time: {passed_time}s')
 
+    def fit_member(self, member, trainX, trainy, valX, valy):
+        """
+        Train one member. The training loss of the trained member
+        is recorded as well.
+        """
+        history, val_loss = super().fit_member(member, trainX, trainy, valX, valy)
+        self.train_loss.append(member.evaluate(trainX, trainy, verbose=0)[1])
+        return history, val_loss
 
     def predict(self, X):
         """
@@ -212,44 +172,3 @@ class ipnn(baseModel):
         """
         mix_mean = pred[:,:,:].mean(axis=2)
         return mix_mean
-
-
-    def save(self, location='', dir_name='ensemble'):
-        """
-        Save the ensemble
-        """
-        path = join(location, dir_name)
-
-        if not exists(path):
-            mkdir(path)
-
-        else:
-            rmtree(path)
-            mkdir(path)
-
-#        with open(join(path, 'hyperparameters.json'), 'w') as file:
-#            json.dump(self.hyperparameters, file)
-
-        self.df_history_hyp.to_csv(join(path, 'hyperparameters_history.csv'))
-
-        for i in range(self.hyperparameters['n_members']):
-            path_h5 = join(path, f"member{i}.h5")
-            save_model(self.ensemble[i], path_h5, include_optimizer=False)
-
-    def load(self, location=None,  dir_name='dem'):
-        """
-        Load the ensemble
-        """
-        if location is None:
-            location = getcwd()
-
-        path = join(location, dir_name)
-        files = glob.glob(join(path,'*.h5'))
-        self.hyperparameters = {}
-        self.hyperparameters['n_members'] = len(files)
-        self.ensemble = []
-
-        for file in files:
-            file_path = join(path, file)
-            self.ensemble.append(load_model(file_path))
-
@@ -0,0 +1,101 @@
+import numpy as np
+
+from os.path import join, exists
+from os import getcwd
+
+from ninolearn.learn.models.dem import DEM
+from ninolearn.learn.losses import nll_gaussian_masked
+from ninolearn.learn.mixture import from_predictions
+
+
+class MultiLeadDEM(DEM):
+    """
+    A deep ensemble model (DEM) that predicts the mean and the standard
+    deviation of a gaussian distribution for several lead times at once. The
+    features are the same for all lead times, hence one network per member
+    replaces one DEM per lead time. The labels come as an array with one
+    column per lead time (see ninolearn.utils.include_lead_labels) in which
+    labels beyond the end of the data are NaN. These are masked in the
+    negative-log-likelihood.
+
+    :type lead_times: array_like
+    :param lead_times: The lead times that are predicted.
+
+    :param kwargs: The hyperparameters of the DEM. Only pdf='normal' is\
+    supported.
+    """
+    def __init__(self, lead_times=(0,), name='multilead_dem', **kwargs):
+        self.lead_times = np.asarray(lead_times)
+
+        if kwargs.get('pdf', 'normal') != 'normal':
+            raise ValueError("The MultiLeadDEM only supports pdf='normal'.")
+
+        super().__init__(name=name, **kwargs)
+
+    def get_model_desc(self, pdf):
+        """
+        Assignes sum weights description to the model. The outputs are the
+        means for each lead time followed by the standard deviations.
+        """
+        self.n_heads = len(self.lead_times)
+
+        self.loss = nll_gaussian_masked
+        self.loss_name = 'nll_gaussian_masked'
+        self.n_outputs = 2 * self.n_heads
+        self.output_names = [f'mean_lead{lead}' for lead in self.lead_times] + \
+                            [f'std_lead{lead}' for lead in self.lead_times]
+
+    def numpy_mixture(self):
+        """
+        The description of the ensemble mixture for the NumPy inference
+        backend.
+        """
+        return {'type': 'gaussian_multi'}
+
+    def predict(self, X):
+        """
+        Generates the ensemble prediction of a model ensemble.
+
+        :param X: The features.
+
+        :returns: The mean and the standard deviation of the mixture, each\
+        with the shape (n_samples, n_lead_times).
+        """
+        return self._mixture(self.predict_members(X))
+
+    def _mixture(self, pred):
+        """
+        returns the ensemble mixture results
+        """
+        mixture = from_predictions(pred, 'gaussian_multi')
+        return [mixture.mean(), mixture.std()]
+
+    def evaluate(self, ytrue, mean_pred, std_pred):
+        """
+        Negative - log -likelihood for the prediction of a gaussian
+        probability, averaged over all lead times with a label.
+        """
+        mask = np.isfinite(ytrue)
+        return super().evaluate(ytrue[mask], mean_pred[mask], std_pred[mask])
+
+    def save(self, location='', dir_name='ensemble'):
+        """
+        Save the ensemble together with the lead times.
+        """
+        super().save(location=location, dir_name=dir_name)
+        np.save(join(location, dir_name, 'lead_times.npy'), self.lead_times)
+
+    def load(self, location=None, dir_name='multilead_dem'):
+        """
+        Load the ensemble
+        """
+        if location is None:
+            location = getcwd()
+
+        path = join(location, dir_name, 'lead_times.npy')
+        if not exists(path):
+            raise FileNotFoundError(f"{path} does not exist.")
+        self.lead_times = np.load(path)
+
+        super().load(location=location, dir_name=dir_name)
+        self.hyperparameters['pdf'] = 'normal'
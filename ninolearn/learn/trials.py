@@ -0,0 +1,183 @@
+"""
+This module contains a persistent store for the trials of the hyperparameter
+search. The trials are saved in a SQLite database in the trialdir which is
+not removed at the end of a monthly run. Hence, a new search can warm-start
+from the best trials of the previous runs and can skip configurations that
+were already evaluated on identical data.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from os.path import join, exists
+from os import mkdir
+
+import numpy as np
+
+from ninolearn.pathes import trialdir
+
+
+def data_version(*arrays):
+    """
+    An identifier of the training data (md5 of the arrays). Trials with the
+    same data version were evaluated on identical data.
+    """
+    md5 = hashlib.md5()
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        md5.update(str(arr.shape).encode())
+        md5.update(str(arr.dtype).encode())
+        md5.update(arr.tobytes())
+    return md5.hexdigest()
+
+
+def _to_json(value):
+    """
+    Convert numpy scalars and tuples such that they can be saved as json.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, tuple):
+        return [_to_json(v) for v in value]
+    return value
+
+
+def config_string(hyperparameters, keys):
+    """
+    The configuration of the hyperparameters as a canonical json string.
+
+    :param hyperparameters: A dictionary with the hyperparameters.
+
+    :param keys: The keys of the hyperparameters that define the\
+    configuration.
+    """
+    config = {key: _to_json(hyperparameters[key]) for key in sorted(keys)}
+    return json.dumps(config, sort_keys=True)
+
+
+class trialStore(object):
+    """
+    A SQLite store of the trials of the hyperparameter search of one model
+    for one lead time and one test decade.
+
+    :type model: str
+    :param model: The model type (e.g. the name of the model).
+
+    :type lead_time: int
+    :param lead_time: The lead time.
+
+    :type decade: int
+    :param decade: The first year of the test decade.
+
+    :type path: str
+    :param path: The path to the database. Default is trials.sqlite in the\
+    trialdir.
+    """
+    def __init__(self, model, lead_time, decade, path=None):
+        if path is None:
+            if not exists(trialdir):
+                mkdir(trialdir)
+            path = join(trialdir, 'trials.sqlite')
+
+        self.model = str(model)
+        self.lead_time = int(lead_time)
+        self.decade = int(decade)
+        self.path = path
+
+        # must be set before trials are recorded or looked up
+        self.data_version = None
+
+        with self._connect() as con:
+            con.execute("""CREATE TABLE IF NOT EXISTS trials (
+                               model TEXT, lead_time INTEGER, decade INTEGER,
+                               data_version TEXT, config TEXT, loss REAL,
+                               created REAL)""")
+            con.execute("""CREATE INDEX IF NOT EXISTS trials_key ON trials
+                               (model, lead_time, decade, data_version)""")
+
+    @contextmanager
+    def _connect(self):
+        """
+        A connection within a transaction which is committed (or rolled back)
+        and closed at the end.
+        """
+        con = sqlite3.connect(self.path)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def _key(self):
+        return (self.model, self.lead_time, self.decade)
+
+    def record(self, hyperparameters, keys, loss):
+        """
+        Save a trial that was evaluated on the current data version.
+
+        :param hyperparameters: The hyperparameters of the trial.
+
+        :param keys: The keys of the hyperparameters that define the\
+        configuration.
+
+        :param loss: The (mean) validation loss of the trial.
+        """
+        loss = float(loss) if np.isfinite(loss) else None
+        with self._connect() as con:
+            con.execute("INSERT INTO trials VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        self._key() + (self.data_version,
+                                       config_string(hyperparameters, keys),
+                                       loss, time.time()))
+
+    def evaluated(self, hyperparameters, keys):
+        """
+        Returns True if the configuration was already evaluated on the current
+        data version.
+        """
+        with self._connect() as con:
+            row = con.execute("""SELECT 1 FROM trials WHERE model=? AND
+                                 lead_time=? AND decade=? AND data_version=?
+                                 AND config=? LIMIT 1""",
+                              self._key() + (self.data_version,
+                                             config_string(hyperparameters, keys))
+                              ).fetchone()
+        return row is not None
+
+    def previous_version(self):
+        """
+        Returns the most recent data version with trials other than the
+        current one (None if there is none).
+        """
+        with self._connect() as con:
+            row = con.execute("""SELECT data_version FROM trials WHERE model=?
+                                 AND lead_time=? AND decade=? AND data_version!=?
+                                 ORDER BY created DESC LIMIT 1""",
+                              self._key() + (self.data_version,)).fetchone()
+        return None if row is None else row[0]
+
+    def best(self, n=1, data_version=None):
+        """
+        Returns the best configurations of the previous trials on one data
+        version as a list of (config, loss) tuples, where config is a
+        dictionary. Each configuration is returned only once (with its best
+        loss). The losses on different data versions are not comparable,
+        hence they are never ranked against each other.
+
+        :type n: int
+        :param n: The number of configurations.
+
+        :type data_version: str
+        :param data_version: The data version of the trials. Default is the\
+        current data version.
+        """
+        if data_version is None:
+            data_version = self.data_version
+
+        with self._connect() as con:
+            rows = con.execute("""SELECT config, MIN(loss) AS best_loss FROM trials
+                                  WHERE model=? AND lead_time=? AND decade=?
+                                  AND data_version=? AND loss IS NOT NULL
+                                  GROUP BY config ORDER BY best_loss LIMIT ?""",
+                               self._key() + (data_version, int(n))).fetchall()
+        return [(json.loads(config), loss) for config, loss in rows]
@@ -20,4 +20,7 @@ rawdir = join(datadir, 'raw')
 processeddir = join(datadir, 'processed')
 modeldir = join(datadir, 'model')
 infodir = join(datadir, 'info')
-preddir = join(datadir, 'forecasts')
\ No newline at end of file
+preddir = join(datadir, 'forecasts')
+
+# kept between the monthly runs (not removed in predictions/s5_finish.py)
+trialdir = join(datadir, 'trials')
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+This module contains methods to compute variables that are derived from raw
+variables, such as the wind speed and the zonal wind stress from the u- and
+v-wind of the NCEP reanalysis.
+
+The derived variables are declared in the dictionary *derived_variables*. The
+formulas are evaluated lazily in blocks along the time axis. Hence, the full
+intermediate fields are never held in memory at once.
+"""
+from os.path import join, exists
+import numpy as np
+import xarray as xr
+import dask
+
+from ninolearn.IO import read_raw
+from ninolearn.pathes import processeddir
+from ninolearn.preprocess.anomaly import _get_period, saveAnomaly
+from ninolearn.utils import generateFileName, small_print_header
+
+
+def _wind_speed(uwnd, vwnd):
+    return np.sqrt(uwnd**2 + vwnd**2)
+
+
+def _zonal_wind_stress(uwnd, vwnd):
+    return uwnd * _wind_speed(uwnd, vwnd)
+
+
+# Each entry consists of the names of the read_raw functions that provide the
+# inputs, the formula (applied to the inputs in the given order) and the
+# attributes that overwrite the ones copied from the first input.
+derived_variables = {
+    'wspd': {'inputs': ['uwind', 'vwind'],
+             'formula': _wind_speed,
+             'attrs': {'long_name': 'Monthly Mean Wind Speed at sigma level 0.995',
+                       'var_desc': 'wind-speed'}
+             },
+    'taux': {'inputs': ['uwind', 'vwind'],
+             'formula': _zonal_wind_stress,
+             'attrs': {'long_name': 'Monthly Mean Zonal Wind Stress at sigma level 0.995',
+                       'var_desc': 'x-wind-stress',
+                       'units': 'm^2/s^2'}
+             },
+    }
+
+
+def _select_region(data, lon_min=None, lon_max=None, lat_min=None,
+                   lat_max=None):
+    """
+    Select a region from the data. The ordering of the latitude axis
+    (ascending or descending) is taken into account.
+    """
+    lat = 'lat' if 'lat' in data.dims else 'latitude'
+    lon = 'lon' if 'lon' in data.dims else 'longitude'
+
+    if data[lat].values[0] > data[lat].values[-1]:
+        lat_slice = slice(lat_max, lat_min)
+    else:
+        lat_slice = slice(lat_min, lat_max)
+
+    return data.loc[{lat: lat_slice, lon: slice(lon_min, lon_max)}]
+
+
+def _lazy_mean_climatology(data, ref_period=True):
+    """
+    Returns the (not yet computed) mean climatology of the data.
+    """
+    period = _get_period(data)
+    if ref_period:
+        data = data.loc['1981-01-01':'2010-12-31']
+    return data.groupby(f'time.{period}').mean(dim="time")
+
+
+def derive(name, *inputs, new=False, time_block=60, lon_min=None,
+           lon_max=None, lat_min=None, lat_max=None, ref_period=True):
+    """
+    Compute a derived variable and save it together with its mean climatology
+    and its anomaly to the processeddir.
+
+    The derived field is evaluated in blocks of *time_block* time steps. The
+    climatology is accumulated in the same pass over the data in which the
+    derived field is written. Hence, it is not computed from scratch again
+    when the anomaly is computed.
+
+    :type name: str
+    :param name: The name of the derived variable (a key of\
+    derived_variables).
+
+    :param inputs: The input xarray DataArrays. If not provided, they are\
+    read with the corresponding read_raw functions.
+
+    :param new: compute the derived variable again (default = False).
+
+    :type time_block: int
+    :param time_block: The number of time steps that are evaluated at once.
+
+    :param lon_min,lon_max: The minimum and the maximum values of the\
+    longitude grid to which the derived variable is restricted \
+    (from 0 to 360 degrees east). Default: no restriction.
+
+    :param lat_min,lat_max: The min and the max values of the latitude\
+    grid to which the derived variable is restricted (from -90 to 90 \
+    degrees north). Default: no restriction.
+
+    :param ref_period: Use the reference period 1981-2010 for the\
+    climatology. Otherwise the entire time series is used.
+    """
+    spec = derived_variables[name]
+
+    if len(inputs) == 0:
+        inputs = [getattr(read_raw, reader)() for reader in spec['inputs']]
+
+    elif len(inputs) != len(spec['inputs']):
+        raise ValueError(f"{name} requires the inputs {spec['inputs']}.")
+
+    inputs = [_select_region(data, lon_min=lon_min, lon_max=lon_max,
+                             lat_min=lat_min, lat_max=lat_max)
+              .chunk({'time': time_block}) for data in inputs]
+
+    data = spec['formula'](*inputs)
+    data.name = name
+    data.attrs = inputs[0].attrs.copy()
+    data.attrs.update(spec['attrs'])
+
+    small_print_header(f"Process {name} from {data.dataset}")
+
+    path = join(processeddir, generateFileName(name, dataset=data.dataset,
+                                               suffix='nc'))
+    path_meanclim = join(processeddir,
+                         generateFileName(name, dataset=data.dataset,
+                                          processed='meanclim', suffix='nc'))
+
+    if exists(path) and exists(path_meanclim) and not new:
+        print(f"{name} already saved in post directory")
+    else:
+        print(f"save {name} in post directory")
+        write = data.to_netcdf(path, compute=False)
+        meanclim = _lazy_mean_climatology(data, ref_period=ref_period)
+
+        # write the derived field and reduce the climatology in one pass
+        _, meanclim = dask.compute(write, meanclim)
+        meanclim.to_netcdf(path_meanclim)
+        new = True
+
+    # the anomaly is computed from the saved field, not from the raw inputs
+    processed = xr.open_dataarray(path, chunks={'time': time_block})
+    saveAnomaly(processed, new)
+    processed.close()
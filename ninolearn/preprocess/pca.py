@@ -1,17 +1,13 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 
 from os.path import join
-from sklearn.decomposition import PCA
-#from mpl_toolkits.basemap import Basemap
-from matplotlib import cm
-from scipy.signal import detrend
+from sklearn.decomposition import PCA, IncrementalPCA
+from scipy.linalg import eigh
 
 from ninolearn.IO.read_processed import data_reader
 from ninolearn.pathes import processeddir
 from ninolearn.utils import generateFileName, scaleMax
-from ninolearn.plot.nino_timeseries import nino_background
 
 
 class pca(PCA):
@@ -25,7 +21,7 @@ class pca(PCA):
     """
     def load_data(self, variable, dataset, processed='anom', startyear=1949,
                   endyear=2018, lon_min=120, lon_max=280, lat_min=-30,
-                  lat_max=30):
+                  lat_max=30, block_size=None):
         """
         Load data for PCA analysis from the desired postprocessed data set.
 
@@ -52,6 +48,9 @@ class pca(PCA):
         grid for which the metrics shell be computed (from -180 to 180 degrees\
         east)
 
+        :type block_size: int
+        :param block_size: If not None, the data is not loaded into memory at\
+        once but streamed in blocks of block_size time steps.
         """
 
         self.variable = variable
@@ -69,36 +68,208 @@ class pca(PCA):
 
         data = self.reader.read_netcdf(variable, dataset, processed)
 
-        self.set_eof_array(data)
+        if block_size is None:
+            self.set_eof_array(data)
+        else:
+            self.set_eof_blocks(data, block_size)
 
     def set_eof_array(self, data):
         """
-        Generates the array that will be analyzed with the EOF.
+        Generates the array that will be analyzed with the EOF. Only the
+        columns of the valid (ocean) grid points are kept. Their positions in
+        the flattened map are stored in ocean_index.
         """
         self.time = data['time']
         self.lon = data['longitude']
         self.lat = data['latitude']
 
-        EOFarr = np.array(data[:, :, :])
+        EOFarr = np.array(data[:, :, :], dtype=np.float32)
 
         self.n_time = len(self.time)
         self.n_lat = len(self.lat)
         self.n_lon = len(self.lon)
         self.nan_index = np.isnan(EOFarr[-1,:,:])
+        self.ocean_index = np.flatnonzero(~self.nan_index)
 
         self.EOFarr = EOFarr.reshape((self.n_time,
-                                      self.n_lat * self.n_lon))
+                                      self.n_lat * self.n_lon))[:, self.ocean_index]
 
 
         self.EOFarr[np.isnan(self.EOFarr)] = 0
-        self.EOFarr = detrend(self.EOFarr, axis=0)
 
+        # remove the least-squares linear trend of each grid point
+        t = np.arange(self.n_time)
+        self.trend_slope, self.trend_intercept = np.polyfit(t, self.EOFarr, 1)
+        self.EOFarr -= (self.trend_intercept
+                        + self.trend_slope * t[:, np.newaxis]).astype(np.float32)
+        self._projections = None
+
+
+    def set_eof_blocks(self, data, block_size=120, fit_trend=True):
+        """
+        Prepares the EOF analysis for data that is streamed in blocks of
+        block_size time steps instead of being held in memory. The linear
+        trend of each grid point is computed in a first pass over the data and
+        removed from each block when it is read.
+
+        :param fit_trend: If False, the first pass is skipped and trend_slope\
+        and trend_intercept need to be set before the blocks are read.
+        """
+        self.time = data['time']
+        self.lon = data['longitude']
+        self.lat = data['latitude']
+
+        self.n_time = len(self.time)
+        self.n_lat = len(self.lat)
+        self.n_lon = len(self.lon)
+        self.nan_index = np.isnan(np.array(data[-1, :, :]))
+        self.ocean_index = np.flatnonzero(~self.nan_index)
+
+        self.data = data
+        self.block_size = block_size
+        self.EOFarr = None
+        self._projections = None
+
+        if not fit_trend:
+            return
+
+        # least-squares linear trend of each grid point
+        t = np.arange(self.n_time)
+        sum_x = np.zeros(len(self.ocean_index))
+        sum_tx = np.zeros(len(self.ocean_index))
+        for start, block in self._raw_blocks():
+            sum_x += block.sum(axis=0)
+            sum_tx += np.matmul(t[start:start + len(block)], block)
+
+        t_mean = t.mean()
+        x_mean = sum_x / self.n_time
+        self.trend_slope = ((sum_tx - self.n_time * t_mean * x_mean)
+                            / np.sum((t - t_mean)**2))
+        self.trend_intercept = x_mean - self.trend_slope * t_mean
+
+    def _block_starts(self):
+        """
+        The first time index of each block. A short remainder is added to the
+        last block.
+        """
+        starts = list(range(0, self.n_time, self.block_size))
+        if len(starts) > 1 and self.n_time - starts[-1] < self.block_size // 2:
+            starts.pop()
+        return starts + [self.n_time]
+
+    def _raw_blocks(self):
+        """
+        Yields the start index and the (not detrended) ocean data of each
+        block.
+        """
+        starts = self._block_starts()
+        for start, end in zip(starts[:-1], starts[1:]):
+            block = np.array(self.data[start:end, :, :], dtype=np.float32)
+            block = block.reshape((end - start, self.n_lat * self.n_lon))
+            block = block[:, self.ocean_index]
+            block[np.isnan(block)] = 0
+            yield start, block
+
+    def _eof_blocks(self):
+        """
+        Yields the blocks of the EOF array.
+        """
+        if self.EOFarr is not None:
+            starts = self._block_starts()
+            for start, end in zip(starts[:-1], starts[1:]):
+                yield self.EOFarr[start:end]
+        else:
+            t = np.arange(self.n_time)
+            for start, block in self._raw_blocks():
+                tb = t[start:start + len(block), np.newaxis]
+                block = block - self.trend_intercept - self.trend_slope * tb
+                yield block.astype(np.float32)
+
+    def _eof_matmul(self, matrix):
+        """
+        Returns the matrix product of the EOF array with the given matrix,
+        either directly or block by block for streamed data.
+        """
+        if self.EOFarr is not None:
+            return np.matmul(self.EOFarr, matrix)
+        return np.concatenate([np.matmul(block, matrix)
+                               for block in self._eof_blocks()])
+
+    def compute_pca(self, solver=None):
+        """
+        Compute the EOFs.
+
+        :type solver: str
+        :param solver: 'full' (sklearn PCA with the full SVD), 'randomized'\
+        (sklearn PCA with a randomized SVD), 'incremental' (IncrementalPCA\
+        fitted block by block) or 'auto'. For 'auto', streamed data is fitted\
+        incrementally, otherwise the randomized SVD is used when the number of\
+        requested components is small compared to the size of the EOF array.\
+        By default, streamed data is fitted incrementally and otherwise the\
+        svd_solver of the constructor is used. Without a random_state of the\
+        constructor, a randomized SVD is seeded with 0 such that the EOFs are\
+        reproducible.
+        """
+        if solver is None:
+            solver = 'incremental' if self.EOFarr is None else self.svd_solver
+
+        elif solver == 'auto':
+            if self.EOFarr is None:
+                solver = 'incremental'
+            elif (isinstance(self.n_components, int) and
+                  self.n_components < 0.8 * min(self.EOFarr.shape)):
+                solver = 'randomized'
+            else:
+                solver = 'full'
+
+        self._projections = None
+
+        if solver == 'incremental':
+            self._fit_incremental()
+
+        elif solver in ['full', 'randomized', 'arpack', 'auto']:
+            if self.EOFarr is None:
+                self._fit_svd(np.concatenate(list(self._eof_blocks())), solver)
+            else:
+                self._fit_svd(self.EOFarr, solver)
+        else:
+            raise ValueError("The solver must be 'full', 'randomized', 'incremental' or 'auto'.")
+
+    def _fit_svd(self, data, solver):
+        """
+        Fit the sklearn PCA with the given SVD solver. The svd_solver and the
+        random_state of the constructor are kept.
+        """
+        svd_solver, random_state = self.svd_solver, self.random_state
+
+        self.svd_solver = solver
+        if random_state is None:
+            self.random_state = 0
+        try:
+            self.fit(data)
+        finally:
+            self.svd_solver, self.random_state = svd_solver, random_state
 
-    def compute_pca(self):
+    def _fit_incremental(self):
         """
-        Simple wrapper around the PCA.fit() method.
+        Fit an IncrementalPCA block by block and copy the results.
         """
-        self.fit(self.EOFarr)
+        if getattr(self, 'block_size', None) is None:
+            self.block_size = 120
+
+        if self.n_components is not None and self.block_size < 2 * self.n_components:
+            raise ValueError("The block size must be at least twice the number of components.")
+
+        ipca = IncrementalPCA(n_components=self.n_components,
+                              whiten=self.whiten)
+        for block in self._eof_blocks():
+            ipca.partial_fit(block)
+
+        for attr in ['components_', 'explained_variance_',
+                     'explained_variance_ratio_', 'singular_values_',
+                     'mean_', 'var_', 'noise_variance_', 'n_components_',
+                     'n_samples_seen_']:
+            setattr(self, attr, getattr(ipca, attr))
 
     def save(self, extension='', filename=None):
         """
@@ -107,12 +278,11 @@ class pca(PCA):
         # save data to first day of month
         save_index = self.time.to_index()
 
-        pca1 = pd.Series(np.matmul(self.EOFarr, self.components_[0, :]),
-                         index=save_index)
-        pca2 = pd.Series(np.matmul(self.EOFarr, self.components_[1, :]),
-                         index=save_index)
-        pca3 = pd.Series(np.matmul(self.EOFarr, self.components_[2, :]),
-                         index=save_index)
+        projections = self.pc_projections()
+
+        pca1 = pd.Series(projections[:, 0], index=save_index)
+        pca2 = pd.Series(projections[:, 1], index=save_index)
+        pca3 = pd.Series(projections[:, 2], index=save_index)
 
         self.df = pd.DataFrame({'pca1': pca1, 'pca2': pca2, 'pca3': pca3})
 
@@ -132,6 +302,11 @@ class pca(PCA):
         """
         Make a plot for the first leading EOFs.
         """
+        import matplotlib.pyplot as plt
+        from matplotlib import cm
+        #from mpl_toolkits.basemap import Basemap
+        from ninolearn.plot.nino_timeseries import nino_background
+
         lon2, lat2 = np.meshgrid(self.lon, self.lat)
 
         try:
@@ -164,15 +339,14 @@ class pca(PCA):
 
             norm = cm.colors.Normalize(vmax=-1, vmin=1.)
             cmap = cm.bwr
-            cs = m.pcolormesh(x, y, scaleMax(
-                              self.components_[i, :].reshape(self.n_lat,
-                                                             self.n_lon)),
+            cs = m.pcolormesh(x, y, self._to_map(scaleMax(
+                              self.components_[i, :])),
                               cmap=cmap, norm=norm)
             m.colorbar(cs)
 
         for i in range(0, 2):
             fig.add_subplot(223+i)
-            projection = np.matmul(self.EOFarr, self.components_[i, :])
+            projection = self.pc_projection(eof=i+1)
             try:
                 nino_background(nino34)
             except:
@@ -181,15 +355,32 @@ class pca(PCA):
 
         plt.show()
 
+    def _to_map(self, vector):
+        """
+        Scatters a vector over the ocean grid points back to a map. Land grid
+        points are set to NaN.
+        """
+        comp_map = np.full(self.n_lat * self.n_lon, np.nan)
+        comp_map[self.ocean_index] = vector
+        return comp_map.reshape(self.n_lat, self.n_lon)
+
     def component_map_(self, eof=1):
         """
         Returns the components as a map.
 
         :param eof: The leading eof (default:1).
         """
-        comp_map = self.components_[eof-1, :].copy().reshape(self.n_lat, self.n_lon)
-        comp_map[self.nan_index] = np.nan
-        return comp_map
+        return self._to_map(self.components_[eof-1, :])
+
+    def pc_projections(self):
+        """
+        Returns the amplitude timeseries of all computed eofs as an array with
+        the dimensions (time, eof). The projections are computed with a single
+        matrix product and cached until the PCA is fitted again.
+        """
+        if getattr(self, '_projections', None) is None:
+            self._projections = self._eof_matmul(self.components_.T)
+        return self._projections
 
     def pc_projection(self, eof=1):
         """
@@ -197,5 +388,275 @@ class pca(PCA):
 
         :param eof: The nth leading eof (default:1).
         """
-        projection = np.matmul(self.EOFarr, self.components_[eof-1, :])
-        return projection
+        return self.pc_projections()[:, eof-1]
+
+    def projector(self):
+        """
+        Returns an eofProjector that projects new data onto the computed eofs.
+        """
+        return eofProjector(self.components_, self.ocean_index,
+                            self.trend_slope, self.trend_intercept,
+                            self.time.to_index()[0], self.n_lat, self.n_lon)
+
+    def save_projector(self, extension='', filename=None):
+        """
+        Saves the eofProjector to a npz-file in the processeddir. The file
+        name is generated in the same way as in .save().
+        """
+        if filename is None:
+            filename = generateFileName(self.variable, self.dataset,
+                                    ''.join((self.processed, extension)))
+
+        self.projector().save(join(processeddir,
+                                   '-'.join(['pcaprojector', filename])))
+
+
+class eofProjector(object):
+    """
+    Projects newly arrived months onto stored eofs without refitting the PCA.
+    The new data is treated in the same way as the data the PCA was fitted
+    on, i.e. only ocean grid points are used and the linear trend of the
+    fitting period is removed.
+
+    :param components: The eofs as array with the dimensions (eof, ocean\
+    grid point).
+
+    :param ocean_index: The position of the ocean grid points in the\
+    flattened map.
+
+    :param trend_slope, trend_intercept: The linear trend of each ocean grid\
+    point (per month) of the fitting period.
+
+    :param time0: The first month of the fitting period.
+
+    :param n_lat, n_lon: The shape of the map.
+    """
+    def __init__(self, components, ocean_index, trend_slope, trend_intercept,
+                 time0, n_lat, n_lon):
+        self.components = components
+        self.ocean_index = ocean_index
+        self.trend_slope = trend_slope
+        self.trend_intercept = trend_intercept
+        self.time0 = pd.to_datetime(time0)
+        self.n_lat = n_lat
+        self.n_lon = n_lon
+
+    def save(self, path):
+        """
+        Save the projector to a npz-file.
+        """
+        np.savez(path, components=self.components,
+                 ocean_index=self.ocean_index,
+                 trend_slope=self.trend_slope,
+                 trend_intercept=self.trend_intercept,
+                 time0=str(self.time0), shape=(self.n_lat, self.n_lon))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a projector from a npz-file.
+        """
+        if not path.endswith('.npz'):
+            path = '.'.join((path, 'npz'))
+
+        with np.load(path) as npz:
+            n_lat, n_lon = npz['shape']
+            return cls(npz['components'], npz['ocean_index'],
+                       npz['trend_slope'], npz['trend_intercept'],
+                       str(npz['time0']), n_lat, n_lon)
+
+    def project(self, data):
+        """
+        Project monthly data onto the eofs.
+
+        :param data: An xarray DataArray with the dimensions (time, latitude,\
+        longitude) on the same grid as the data the PCA was fitted on.
+
+        :returns: A DataFrame with the amplitude timeseries of all eofs.
+        """
+        time = data['time'].to_index()
+        t = ((time.year - self.time0.year) * 12
+             + time.month - self.time0.month).values
+
+        arr = np.array(data[:, :, :], dtype=np.float32)
+        arr = arr.reshape((len(time), self.n_lat * self.n_lon))[:, self.ocean_index]
+        arr[np.isnan(arr)] = 0
+        arr = arr - self.trend_intercept - self.trend_slope * t[:, np.newaxis]
+
+        projections = np.matmul(arr, self.components.T)
+        columns = [f'pca{i+1}' for i in range(projections.shape[1])]
+        return pd.DataFrame(projections, index=time, columns=columns)
+
+
+class multiFieldEOF(object):
+    """
+    Combined EOF analysis of several fields (e.g. SST, wind stress and SSH).
+    The fields are streamed in blocks of time steps. In a single pass over the
+    blocks, the cross-covariance matrix of the ocean grid points of all
+    fields is accumulated together with the sums that are needed to remove
+    the linear trend. Hence, the memory is bounded by the size of the
+    covariance matrix and not by the concatenated time x space array.
+
+    Each field is normalized by the square root of its mean variance such
+    that all fields contribute equally to the combined modes.
+
+    :type n_components: int
+    :param n_components: The number of eofs that are computed.
+
+    :type block_size: int
+    :param block_size: The number of time steps per block.
+    """
+    def __init__(self, n_components=3, block_size=120):
+        self.n_components = n_components
+        self.block_size = block_size
+
+    def load_data(self, fields, startyear=1949, endyear=2018, lon_min=120,
+                  lon_max=280, lat_min=-30, lat_max=30):
+        """
+        Load the fields from the processed data sets.
+
+        :type fields: list
+        :param fields: A list of (variable, dataset, processed) tuples, e.g.\
+        [('sst', 'ERSSTv5', 'anom'), ('taux', 'NCEP', 'anom')].
+
+        For the other parameters see :meth:`pca.load_data`.
+        """
+        self.startdate = pd.to_datetime(str(startyear))
+        self.enddate = (pd.to_datetime(str(endyear)) +
+                        pd.tseries.offsets.YearEnd(0))
+
+        self.reader = data_reader(startdate=self.startdate,
+                                  enddate=self.enddate,
+                                  lon_min=lon_min, lon_max=lon_max,
+                                  lat_min=lat_min, lat_max=lat_max)
+
+        self.set_fields([self.reader.read_netcdf(*field) for field in fields],
+                        names=[generateFileName(*field) for field in fields])
+
+    def set_fields(self, data_list, names=None):
+        """
+        Set the fields (xarray DataArrays with the dimensions (time,\
+        latitude, longitude)) that are analyzed together.
+
+        :param names: The names of the fields that are used for the file name\
+        in .save(). Default are the names of the DataArrays.
+        """
+        self.fields = []
+        for data in data_list:
+            field = pca()
+            field.set_eof_blocks(data, block_size=self.block_size,
+                                 fit_trend=False)
+            self.fields.append(field)
+
+        self.time = self.fields[0].time
+        self.n_time = self.fields[0].n_time
+        if any(field.n_time != self.n_time for field in self.fields):
+            raise ValueError("All fields need to have the same time axis.")
+
+        # columns of each field in the combined array
+        bounds = np.cumsum([0] + [len(field.ocean_index) for field in self.fields])
+        self.field_slices = [slice(low, high) for low, high in
+                             zip(bounds[:-1], bounds[1:])]
+        self.n_space = bounds[-1]
+
+        if names is None:
+            names = [str(data.name) for data in data_list]
+        self.names = names
+
+    def fit(self):
+        """
+        Compute the combined eofs.
+        """
+        t = np.arange(self.n_time)
+        cov = np.zeros((self.n_space, self.n_space))
+        sums = np.zeros((self.n_space, 2))
+
+        for blocks in zip(*[field._raw_blocks() for field in self.fields]):
+            start = blocks[0][0]
+            block = np.concatenate([b for _, b in blocks], axis=1).astype(float)
+            tb = t[start:start + len(block)]
+
+            cov += np.matmul(block.T, block)
+            sums[:, 0] += block.sum(axis=0)
+            sums[:, 1] += np.matmul(tb, block)
+
+        # remove the linear trend: Y'Y = X'X - X'Q (Q'Q)^-1 Q'X with Q = [1, t]
+        qq = np.array([[self.n_time, t.sum()], [t.sum(), np.sum(t**2)]])
+        coef = np.linalg.solve(qq, sums.T)
+        cov -= np.matmul(sums, coef)
+        cov /= self.n_time - 1
+
+        for field, sl in zip(self.fields, self.field_slices):
+            field.trend_intercept = coef[0, sl]
+            field.trend_slope = coef[1, sl]
+
+        # normalize each field by its mean variance
+        self.weights = np.zeros(self.n_space)
+        for sl in self.field_slices:
+            n_field = sl.stop - sl.start
+            self.weights[sl] = 1. / np.sqrt(np.trace(cov[sl, sl]) / n_field)
+        cov *= np.outer(self.weights, self.weights)
+
+        eigvals, eigvecs = eigh(cov, subset_by_index=[self.n_space - self.n_components,
+                                                      self.n_space - 1])
+
+        self.components_ = eigvecs[:, ::-1].T
+        self.explained_variance_ = eigvals[::-1]
+        self.explained_variance_ratio_ = self.explained_variance_ / np.trace(cov)
+        self._projections = None
+
+    def _eof_blocks(self):
+        """
+        Yields the blocks of the detrended and normalized combined array.
+        """
+        for blocks in zip(*[field._eof_blocks() for field in self.fields]):
+            yield np.concatenate(blocks, axis=1) * self.weights
+
+    def pc_projections(self):
+        """
+        Returns the amplitude timeseries of all eofs as an array with the
+        dimensions (time, eof). The projections are computed in a second pass
+        over the data and cached.
+        """
+        if getattr(self, '_projections', None) is None:
+            self._projections = np.concatenate(
+                    [np.matmul(block, self.components_.T)
+                     for block in self._eof_blocks()])
+        return self._projections
+
+    def pc_projection(self, eof=1):
+        """
+        Returns the amplitude timeseries of the specified eof.
+
+        :param eof: The nth leading eof (default:1).
+        """
+        return self.pc_projections()[:, eof-1]
+
+    def component_map_(self, eof=1, field=0):
+        """
+        Returns the part of a combined eof that belongs to one field as a map.
+
+        :param eof: The leading eof (default:1).
+
+        :param field: The index of the field (default:0).
+        """
+        sl = self.field_slices[field]
+        return self.fields[field]._to_map(self.components_[eof-1, sl])
+
+    def save(self, extension='', filename=None):
+        """
+        Saves the amplitude timeseries of all eofs to a csv-file.
+        """
+        projections = self.pc_projections()
+        columns = [f'pca{i+1}' for i in range(projections.shape[1])]
+        self.df = pd.DataFrame(projections, index=self.time.to_index(),
+                               columns=columns)
+
+        if filename is None:
+            filename = '.'.join(('+'.join(self.names) + extension, 'csv'))
+        else:
+            filename = '.'.join((filename,'csv'))
+
+        filename = '-'.join(['pca', filename])
+
+        self.df.to_csv(join(processeddir, filename))
@@ -214,74 +214,213 @@ def prep_dmi():
     df.to_csv(join(processeddir, 'dmi.csv'))
     
 
-def calc_warm_pool_edge():
+def calc_warm_pool_edge(isotherm=28., lat_min=0, lat_max=0):
     """
-    calculate the warm pool edge
+    calculate the warm pool edge, i.e. the distance in km from 120E to the
+    easternmost crossing of the isotherm in the (meridionally averaged) SST
+    of the given latitude band. The computation is done for all time steps at
+    once.
+
+    :type isotherm: float
+    :param isotherm: The isotherm (in degree Celsius) that defines the edge.
+
+    :param lat_min,lat_max: The latitude band over which the SST is averaged\
+    (default: the equator).
     """
     reader = data_reader(startdate='1948-01', enddate='2020-10',lon_min=120, lon_max=290) # enddate: was 2018-12
     sst = reader.read_netcdf('sst', dataset='ERSSTv5', processed='')
 
-    sst_eq = sst.loc[dict(latitude=0)]
-    warm_pool_edge = np.zeros(sst_eq.shape[0])
-    indeces = np.zeros(sst_eq.shape[0])
-
-    # TODO  not very efficent
-    for i in range(sst_eq.shape[0]):
-        index = np.argwhere(sst_eq[i].values>28.).max()
-        indeces[i] = index
+    sst_band = sst.loc[dict(latitude=slice(lat_min, lat_max))]
+    sst_eq = sst_band.mean(dim='latitude').values
+    dlon = np.abs(np.diff(sst.longitude.values)).mean()
 
-        slope = sst_eq[i, index] - sst_eq[i, index-1]
+    # index of the last grid point above the isotherm for each time step
+    above = sst_eq > isotherm
+    n_time, n_lon = above.shape
+    index = n_lon - 1 - np.argmax(above[:, ::-1], axis=1)
 
-        intercept28C = (sst_eq[i, index] - 28.) * slope + index
+    rows = np.arange(n_time)
+    slope = sst_eq[rows, index] - sst_eq[rows, index-1]
+    intercept = (sst_eq[rows, index] - isotherm) * slope + index
 
-        warm_pool_edge[i] = intercept28C * 2.5 * 111.321
+    warm_pool_edge = intercept * dlon * 111.321
+    warm_pool_edge[~above.any(axis=1)] = np.nan
 
     df = pd.DataFrame(data=warm_pool_edge,index=sst.time.values, columns=['total'])
     df.index.name = 'time'
 
     df.to_csv(join(processeddir, 'wp_edge.csv'))
+    return df
+
+
+def _split_last_obs(line):
+    """
+    Split the line with the last observations of the IRI/CPC archive into the
+    last observed season and the last observed month.
+    """
+    last_obs_info = line[16:].strip()
+    last_obs_info = last_obs_info.replace(" ","")
+    if last_obs_info[3] == '-':
+        return last_obs_info[0:8], last_obs_info[8:]
+    else:
+        return last_obs_info[0:7], last_obs_info[7:]
+
+
+def _read_other_forecasts_txt(offset=0):
+    """
+    Read the IRI/CPC forecast archive (other_forecasts.txt) starting at the
+    given byte offset in a single pass.
+
+    :returns: A list with the issue months, the byte offsets of the\
+    corresponding 'Forecast issued' lines, the last observations and the\
+    forecast lines (with the model names) of each issue month.
+    """
+    issues, offsets, last_obs, blocks = [], [], [], []
+
+    with open(join(rawdir, "other_forecasts.txt"), "rb") as f:
+        f.seek(offset)
+        while True:
+            pos = f.tell()
+            line = f.readline().decode('latin-1')
+            if not line:
+                break
+            if not line.startswith('Forecast issued '):
+                continue
+
+            issues.append(line[16:].strip())
+            offsets.append(pos)
+
+            f.readline() # first/last month info
+            last_obs.append(_split_last_obs(f.readline().decode('latin-1')))
+
+            block = []
+            while True:
+                line = f.readline().decode('latin-1')
+                if line.strip() in ['end', '']:
+                    break
+                block.append(line.rstrip('\r\n'))
+            blocks.append(block)
+
+    return issues, offsets, last_obs, blocks
+
+
+def _forecasts_to_dataset(issues, last_obs, blocks):
+    """
+    Convert the parsed forecast blocks to a data set with the dimensions
+    (issued, model, lead). The fixed-width forecast values of all blocks are
+    converted at once.
+    """
+    lines = [line for block in blocks for line in block]
+
+    # forecasts are made for 9-month lead times in columns of 4 characters
+    fixed = np.array([line[:36].ljust(36) for line in lines], dtype='U36')
+    values = np.char.strip(fixed.view('U4').reshape(-1, 9))
+    values = np.where(values == '', '-999', values).astype(float)
+    values = np.where(values == -999, np.nan, values * 0.01)
+
+    # the model name follows the forecast values, otherwise use the position
+    names = []
+    for block in blocks:
+        block_names = []
+        for k, line in enumerate(block):
+            name = line[36:].strip() or f'model{k}'
+            if name in block_names:
+                name = f'{name}_{k}'
+            block_names.append(name)
+        names.append(block_names)
+
+    models = list(dict.fromkeys(name for block in names for name in block))
+    model_index = {name: k for k, name in enumerate(models)}
+
+    forecast = np.full((len(issues), len(models), 9), np.nan)
+    position = np.full((len(issues), len(models)), -1, dtype=int)
+
+    row = 0
+    for i, block_names in enumerate(names):
+        for k, name in enumerate(block_names):
+            forecast[i, model_index[name], :] = values[row]
+            position[i, model_index[name]] = k
+            row += 1
+
+    issued = pd.to_datetime(issues, format='%b %Y')
+    ds = xr.Dataset({'forecast': (['issued', 'model', 'lead'], forecast),
+                     'position': (['issued', 'model'], position),
+                     'last_obs_seas': (['issued'], [obs[0] for obs in last_obs]),
+                     'last_obs_month': (['issued'], [obs[1] for obs in last_obs])},
+                    coords={'issued': issued, 'model': models,
+                            'lead': np.arange(9)})
+    return ds
+
+
+def parse_other_forecasts(new=False):
+    """
+    Convert the IRI/CPC forecast archive (other_forecasts.txt) into a data set
+    indexed by (issued, model, lead) that is saved to the processeddir
+    together with a byte-offset index of the issue months. If the archive was
+    parsed before, only the part of the file starting at the last indexed
+    issue month is read again.
+
+    :param new: Parse the entire archive again (default = False).
+
+    :returns: The data set with the forecasts.
+    """
+    path_archive = join(processeddir, 'other_forecasts_archive.nc')
+    path_index = join(processeddir, 'other_forecasts_index.csv')
+
+    archive, offset = None, 0
+    if exists(path_archive) and exists(path_index) and not new:
+        index = pd.read_csv(path_index, index_col=0)
+        offset = int(index['offset'].iloc[-1])
+        last_issue = index.index[-1]
+
+        # check that the file was not changed before the last indexed issue
+        with open(join(rawdir, "other_forecasts.txt"), "rb") as f:
+            f.seek(offset)
+            line = f.readline().decode('latin-1')
+
+        if line.strip() == f'Forecast issued {last_issue}':
+            with xr.open_dataset(path_archive) as ds:
+                archive = ds.load()
+        else:
+            index, offset = None, 0
+
+    issues, offsets, last_obs, blocks = _read_other_forecasts_txt(offset)
+    ds = _forecasts_to_dataset(issues, last_obs, blocks)
+    new_index = pd.DataFrame({'offset': offsets}, index=issues)
+    new_index.index.name = 'issued'
+
+    if archive is not None:
+        archive = archive.drop_sel(issued=ds.issued.values, errors='ignore')
+        ds = xr.concat([archive, ds], dim='issued', join='outer')
+        ds['position'] = ds['position'].fillna(-1).astype(int)
+        new_index = pd.concat([index.drop(new_index.index, errors='ignore'),
+                               new_index])
+
+    ds.to_netcdf(path_archive)
+    new_index.to_csv(path_index)
+    return ds
 
 
 def prep_other_forecasts(month,year):
     """
-    Extract IRI/CPC forecast for desired period
+    Extract IRI/CPC forecast for desired period from the parsed forecast
+    archive (see .parse_other_forecasts()).
     """
     print("Prepare IRI/CPC forecast data.")
     IRICPC = []
-    f = open(join(rawdir,"other_forecasts.txt"), "r")
-    go = True
-    while go:
-        line = f.readline()
-        if line == 'Forecast issued '+month+' '+year+'\n':
-            go = False
-            f.readline() # first/last month info
-            last_obs = f.readline() # last obs info
-            last_obs_info = last_obs[16:].strip()
-            last_obs_info = last_obs_info.replace(" ","")
-            if last_obs_info[3] == '-':
-                last_obs_seas = last_obs_info[0:8]
-                last_obs_month = last_obs_info[8:]
-            else:
-                last_obs_seas = last_obs_info[0:7]
-                last_obs_month = last_obs_info[7:]
-            IRICPC.append(last_obs_seas)
-            IRICPC.append(last_obs_month)
-            read_forecast = True
-            while read_forecast:
-                line = f.readline()
-                if line == 'end\n' or line == '\n':
-                    read_forecast = False
-                    break
-                fc = np.zeros(9) # forecasts are made for 9-month lead times
-                for i in range(9):
-                    fc[i] = float(line[4*i:4*(i+1)])*0.01
-                    fc = np.where(fc==-9.99, np.nan, fc)
-                IRICPC.append(fc)
-            print('IRI/CPC forecasts saved')    
-        if not line:
-            print('IRI/CPC forecast not found for desired period')
-            break
-    f.close()
-    return IRICPC
+    archive = parse_other_forecasts()
 
+    issued = pd.to_datetime(f'{month} {year}', format='%b %Y')
+    if issued not in archive.issued.to_index():
+        print('IRI/CPC forecast not found for desired period')
+        return IRICPC
 
+    data = archive.sel(issued=issued)
+    IRICPC.append(str(data.last_obs_seas.values))
+    IRICPC.append(str(data.last_obs_month.values))
+
+    position = data.position.values
+    for k in np.argsort(position)[np.sort(position) >= 0]:
+        IRICPC.append(data.forecast.values[k])
+    print('IRI/CPC forecasts saved')
+    return IRICPC
@@ -1,30 +1,259 @@
-#from ninolearn.IO import read_raw
+"""
+This module contains methods to regrid data to the 2.5x2.5 grid of the NCEP
+reanalysis.
+
+The interpolation weights are computed once per pair of source and target
+grid and are saved as sparse matrices in the processeddir. Hence, regridding
+further variables on the same grid is a single sparse matrix product over all
+time steps.
+"""
+import hashlib
+from os.path import join, exists
+from os import mkdir
 
 import xarray as xr
 import numpy as np
-import iris
-import iris.analysis
-from iris.coords import DimCoord
-from iris.cube import Cube
+from scipy import sparse
+
+from ninolearn.pathes import processeddir
+
+weightdir = join(processeddir, 'regrid_weights')
+
+# weights that were already loaded or computed in this session
+_weights_cache = {}
+
+
+def _coord_names(data):
+    """
+    Returns the names of the latitude and the longitude dimension.
+    """
+    lat = 'lat' if 'lat' in data.dims else 'latitude'
+    lon = 'lon' if 'lon' in data.dims else 'longitude'
+    return lat, lon
+
+
+def _is_periodic(lon):
+    """
+    Checks if the longitude grid spans the entire globe.
+    """
+    dlon = np.abs(np.diff(lon)).min()
+    return lon.max() - lon.min() + dlon >= 360. - 1e-6
+
+
+def _bilinear_weights_1d(x_in, x_out, periodic=False):
+    """
+    Linear interpolation weights from x_in to x_out. Values outside of the
+    source grid are linearly extrapolated.
+
+    :returns: A sparse matrix with the shape (len(x_out), len(x_in)).
+    """
+    n_in = len(x_in)
+    order = np.argsort(x_in)
+    xs = x_in[order]
+
+    if periodic:
+        xs = np.append(xs, xs[0] + 360.)
+        order = np.append(order, order[0])
+        x_out = xs[0] + np.mod(x_out - xs[0], 360.)
+
+    i = np.clip(np.searchsorted(xs, x_out, side='right') - 1, 0, len(xs) - 2)
+    t = (x_out - xs[i]) / (xs[i+1] - xs[i])
+
+    rows = np.repeat(np.arange(len(x_out)), 2)
+    cols = np.stack((order[i], order[i+1]), axis=1).ravel()
+    vals = np.stack((1. - t, t), axis=1).ravel()
+
+    return sparse.csr_matrix((vals, (rows, cols)), shape=(len(x_out), n_in))
+
+
+def _cell_bounds(x, lower=None, upper=None):
+    """
+    The cell boundaries of a grid (in the order of x) that lie in the middle
+    between neighbouring grid points.
+    """
+    order = np.argsort(x)
+    xs = x[order]
+    mid = 0.5 * (xs[1:] + xs[:-1])
+    low = np.append(xs[0] - (mid[0] - xs[0]), mid)
+    high = np.append(mid, xs[-1] + (xs[-1] - mid[-1]))
+
+    if lower is not None:
+        low, high = np.maximum(low, lower), np.maximum(high, lower)
+    if upper is not None:
+        low, high = np.minimum(low, upper), np.minimum(high, upper)
+
+    bounds = np.zeros((len(x), 2))
+    bounds[order, 0] = low
+    bounds[order, 1] = high
+    return bounds
+
+
+def _conservative_weights_1d(x_in, x_out, latitude=False, periodic=False):
+    """
+    First order conservative weights from x_in to x_out that are given by the
+    overlap of the cells. For the latitude the overlap is measured in sin(lat)
+    such that it is proportional to the area.
 
+    :returns: A sparse matrix with the shape (len(x_out), len(x_in)).
+    """
+    if latitude:
+        b_in = np.sin(np.deg2rad(_cell_bounds(x_in, -90., 90.)))
+        b_out = np.sin(np.deg2rad(_cell_bounds(x_out, -90., 90.)))
+        shifts = [0.]
+    else:
+        b_in = _cell_bounds(x_in)
+        b_out = _cell_bounds(x_out)
+        shifts = [-360., 0., 360.] if periodic else [0.]
+
+    overlap = np.zeros((len(x_out), len(x_in)))
+    for shift in shifts:
+        high = np.minimum(b_out[:, 1:2], b_in[:, 1] + shift)
+        low = np.maximum(b_out[:, 0:1], b_in[:, 0] + shift)
+        overlap += np.maximum(high - low, 0.)
+
+    total = overlap.sum(axis=1, keepdims=True)
+    overlap = np.divide(overlap, total, out=np.zeros_like(overlap),
+                        where=total > 0)
+    return sparse.csr_matrix(overlap)
+
+
+class Regridder(object):
+    """
+    Regrids data from a rectilinear source grid to a rectilinear target grid
+    using precomputed sparse weights.
+
+    :type lat_in, lon_in: np.ndarray
+    :param lat_in, lon_in: The latitude and the longitude of the source grid.
+
+    :type lat_out, lon_out: np.ndarray
+    :param lat_out, lon_out: The latitude and the longitude of the target grid.\
+    Default is the 2.5x2.5 grid of the NCEP reanalysis.
+
+    :type method: str
+    :param method: Either 'bilinear' (linear interpolation with\
+    extrapolation) or 'conservative' (first order conservative remapping).
+    """
+    def __init__(self, lat_in, lon_in, lat_out=None, lon_out=None,
+                 method='bilinear'):
+        if method not in ['bilinear', 'conservative']:
+            raise ValueError("The method must be 'bilinear' or 'conservative'.")
+
+        if lat_out is None:
+            lat_out = np.arange(-90, 90.01, 2.5)
+        if lon_out is None:
+            lon_out = np.arange(0, 359.99, 2.5)
+
+        self.lat_in = np.asarray(lat_in, dtype=float)
+        self.lon_in = np.asarray(lon_in, dtype=float)
+        self.lat_out = np.asarray(lat_out, dtype=float)
+        self.lon_out = np.asarray(lon_out, dtype=float)
+        self.method = method
+
+        self.weights = self.get_weights()
+
+    def _key(self):
+        """
+        An identifier of the pair of source and target grid.
+        """
+        md5 = hashlib.md5(self.method.encode())
+        for coord in [self.lat_in, self.lon_in, self.lat_out, self.lon_out]:
+            md5.update(np.array(len(coord)).tobytes())
+            md5.update(np.round(coord, 6).tobytes())
+        return md5.hexdigest()
+
+    def compute_weights(self):
+        """
+        Compute the sparse weight matrix with the shape\
+        (n_lat_out * n_lon_out, n_lat_in * n_lon_in).
+        """
+        periodic = _is_periodic(self.lon_in)
+        if self.method == 'bilinear':
+            w_lat = _bilinear_weights_1d(self.lat_in, self.lat_out)
+            w_lon = _bilinear_weights_1d(self.lon_in, self.lon_out,
+                                         periodic=periodic)
 
-def to2_5x2_5(data):
+        elif self.method == 'conservative':
+            w_lat = _conservative_weights_1d(self.lat_in, self.lat_out,
+                                             latitude=True)
+            w_lon = _conservative_weights_1d(self.lon_in, self.lon_out,
+                                             periodic=periodic)
+
+        return sparse.kron(w_lat, w_lon, format='csr')
+
+    def get_weights(self):
+        """
+        Get the weights from the cache, from the weight directory or compute
+        them if they are not available yet.
+        """
+        key = self._key()
+        if key in _weights_cache:
+            return _weights_cache[key]
+
+        path = join(weightdir, f'{self.method}_{key}.npz')
+        if exists(path):
+            weights = sparse.load_npz(path)
+        else:
+            print(f"Compute {self.method} regridding weights")
+            weights = self.compute_weights()
+            if not exists(weightdir):
+                mkdir(weightdir)
+            sparse.save_npz(path, weights)
+
+        _weights_cache[key] = weights
+        return weights
+
+    def regrid_array(self, arr):
+        """
+        Regrid a numpy array which has the latitude and the longitude as the
+        last two dimensions.
+        """
+        lead_shape = arr.shape[:-2]
+        arr = arr.reshape((-1, len(self.lat_in) * len(self.lon_in))).T
+
+        if self.method == 'conservative':
+            # renormalize by the valid fraction of the target cells
+            valid = np.isfinite(arr)
+            num = self.weights.dot(np.where(valid, arr, 0.))
+            den = self.weights.dot(valid.astype(float))
+            out = np.divide(num, den, out=np.full_like(num, np.nan),
+                            where=den > 0)
+        else:
+            out = self.weights.dot(arr)
+
+        return out.T.reshape(lead_shape + (len(self.lat_out),
+                                           len(self.lon_out)))
+
+    def __call__(self, data):
+        """
+        Regrid an xarray DataArray.
+
+        :param data: An xarray DataArray.
+        """
+        lat, lon = _coord_names(data)
+        data = data.transpose(*[d for d in data.dims if d not in [lat, lon]],
+                              lat, lon)
+
+        values = self.regrid_array(np.asarray(data.values, dtype=float))
+
+        dims = data.dims[:-2] + ('latitude', 'longitude')
+        coords = {d: data[d] for d in data.dims[:-2]}
+        coords['latitude'] = self.lat_out
+        coords['longitude'] = self.lon_out
+
+        return xr.DataArray(values.astype(data.dtype), dims=dims,
+                            coords=coords, name=data.name,
+                            attrs=data.attrs.copy())
+
+
+def to2_5x2_5(data, method='bilinear'):
     """
     Regrids data the 2.5x2.5 from the NCEP reanalysis data set.
 
     :param data: An xarray DataArray.
+
+    :type method: str
+    :param method: Either 'bilinear' or 'conservative'.
     """
-    data_iris = data.to_iris()
-    latitude = DimCoord(np.arange(-90, 90.01, 2.5),
-                     standard_name='latitude',
-                     units='degrees')
-    longitude = DimCoord(np.arange(0, 359.99, 2.5),
-                      standard_name='longitude',
-                      units='degrees')
-    cube = Cube(np.zeros((73, 144), np.float32),
-             dim_coords_and_dims=[(latitude, 0),
-                                 (longitude, 1)])
-    scheme = iris.analysis.Linear(extrapolation_mode='extrapolate')
-    data_new = data_iris.regrid(cube,scheme)
-    data_regridded = xr.DataArray.from_iris(data_new)
-    return data_regridded
\ No newline at end of file
+    lat, lon = _coord_names(data)
+    regridder = Regridder(data[lat].values, data[lon].values, method=method)
+    return regridder(data)
@@ -4,7 +4,6 @@ to which they belong. Help them find there home!
 """
 
 import numpy as np
-from scipy.stats import spearmanr, pearsonr
 
 def print_header(string):
     print()
@@ -159,6 +158,31 @@ def include_time_lag(X, n_lags=0, step=1):
     return Xnew
 
 
+def include_lead_labels(y, lead_times, offset=0):
+    """
+    Stack the labels for several lead times. Row i contains the labels
+    y[i + offset + lead_time] for each lead time. Labels beyond the end of the
+    data are NaN.
+
+    :param y: The label time series.
+
+    :param lead_times: The lead times.
+
+    :param offset: The offset between the feature row and the label at a\
+    lead time of 0 months.
+
+    :returns: An array with the shape (len(y) - offset - min(lead_times),\
+    len(lead_times)).
+    """
+    lead_times = np.asarray(lead_times)
+    n_rows = len(y) - offset - lead_times.min()
+
+    ypad = np.append(np.asarray(y, dtype=float),
+                     np.full(lead_times.max() - lead_times.min(), np.nan))
+    index = np.arange(n_rows)[:, np.newaxis] + offset + lead_times[np.newaxis, :]
+    return ypad[index]
+
+
 def nino_to_category(nino, categories=None, threshold=None):
     """
     This method translates a NINO index value into a category. NOTE: Either the
@@ -234,6 +258,8 @@ def spearman_lag(x, y, max_lags=80):
 
     :returns: A timeseries with the lag correlations.
     """
+    from scipy.stats import spearmanr
+
     r = np.zeros(max_lags)
     r[0] = spearmanr(x[:], y[:])[0]
     for i in np.arange(1, max_lags):
@@ -254,6 +280,8 @@ def pearson_lag(x, y, max_lags=28):
 
     :returns: A timeseries with the lag correlations and the corresponding p-value.
     """
+    from scipy.stats import pearsonr
+
     r, p = np.zeros(max_lags+1), np.zeros(max_lags+1)
     r[0], p[0] = pearsonr(x[:], y[:])
     for i in np.arange(1, max_lags+1):
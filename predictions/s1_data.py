@@ -89,27 +89,18 @@ postprocess(vwind)
 # =============================================================================
 # Calculate wind speed and wind stress in x-direction
 # =============================================================================
-import numpy as np
-
-wspd = np.sqrt(uwind**2 + vwind**2)
-wspd.attrs = uwind.attrs.copy()
-wspd.name = 'wspd'
-wspd.attrs['long_name'] = 'Monthly Mean Wind Speed at sigma level 0.995'
-wspd.attrs['var_desc'] = 'wind-speed'
-postprocess(wspd)
+from ninolearn.preprocess.derived import derive
 
-taux = uwind * wspd
-taux.attrs = uwind.attrs.copy()
-taux.name = 'taux'
-taux.attrs['long_name'] = 'Monthly Mean Zonal Wind Stress at sigma level 0.995'
-taux.attrs['var_desc'] = 'x-wind-stress'
-taux.attrs['units'] = 'm^2/s^2'
-postprocess(taux)
+# the derived fields are evaluated in time blocks and restricted to the
+# region that is used in the data pipeline
+derive('wspd', uwind, vwind, lon_min=120, lon_max=280, lat_min=-30, lat_max=30)
+derive('taux', uwind, vwind, lon_min=120, lon_max=280, lat_min=-30, lat_max=30)
 
 
 # =============================================================================
 # Prepare the IRI/CPC forecast data
 # =============================================================================
+import numpy as np
 from ninolearn.preprocess.prepare import prep_other_forecasts
 from s0_start import start_pred_y, start_pred_m
 from ninolearn.utils import num_to_month, pred_filename
@@ -10,7 +10,7 @@ import numpy as np
 from sklearn.preprocessing import StandardScaler
 from os.path import join
 
-from ninolearn.utils import include_time_lag
+from ninolearn.utils import include_time_lag, include_lead_labels
 from ninolearn.IO.read_processed import data_reader
 from ninolearn.learn.models.dem import DEM
 from ninolearn.learn.fit import cross_training
@@ -44,22 +44,19 @@ np.save(join(infodir,'lead_times'), lead_times)
 # Process data and train model
 # =============================================================================
 
-def pipeline(lead_time, return_persistance=False):
-    """
-    Data pipeline for the processing of the data before the Deep Ensemble
-    is trained.
+# include values from 3 and 6 months previously as predictor variables
+n_lags = 3
+step = 3
 
-    :type lead_time: int
-    :param lead_time: The lead time in month.
+# shift such that lead time corresponds to the definition of lead time
+shift = 3
 
-    :type return_persistance: boolean
-    :param return_persistance: Return as the persistance as well.
+def features():
+    """
+    Read and scale the features (not yet lagged) and the ONI.
 
-    :returns: The feature "X" (at observation time), the label "y" (at lead
-    time), the target season "timey" (least month) and if selected the
-    label at observation time "y_persistance". Hence, the output comes as:
-    X, y, timey, y_persistance.
-    """      
+    :returns: The scaled feature array "Xorg" and the ONI.
+    """
     reader = data_reader(startdate='1960-01', enddate=endyr+'-'+endmth)
 
     # indices
@@ -76,13 +73,6 @@ def pipeline(lead_time, return_persistance=False):
     taux_WP = taux.loc[dict(lat=slice(2.5,-2.5), lon=slice(120, 160))]
     taux_WP_mean = taux_WP.mean(dim='lat').mean(dim='lon')
 
-    # include values from 3 and 6 months previously as predictor variables
-    n_lags = 3
-    step = 3
-
-    # shift such that lead time corresponds to the definition of lead time
-    shift = 3
-
     # process features
     feature_unscaled = np.stack((oni,
                                  wwv,
@@ -98,6 +88,26 @@ def pipeline(lead_time, return_persistance=False):
     # set nans to 0.
     Xorg = np.nan_to_num(Xorg)
     np.save(join(infodir,'Xorg'), Xorg) 
+    return Xorg, oni
+
+
+def pipeline(lead_time, return_persistance=False):
+    """
+    Data pipeline for the processing of the data before the Deep Ensemble
+    is trained.
+
+    :type lead_time: int
+    :param lead_time: The lead time in month.
+
+    :type return_persistance: boolean
+    :param return_persistance: Return as the persistance as well.
+
+    :returns: The feature "X" (at observation time), the label "y" (at lead
+    time), the target season "timey" (least month) and if selected the
+    label at observation time "y_persistance". Hence, the output comes as:
+    X, y, timey, y_persistance.
+    """      
+    Xorg, oni = features()
 
     # arange the feature array
     X = Xorg[:-lead_time-shift,:]
@@ -117,6 +127,44 @@ def pipeline(lead_time, return_persistance=False):
     else:
         return X, y, timey
 
+
+def pipeline_multilead(lead_times, return_persistance=False):
+    """
+    Data pipeline for the MultiLeadDEM which is trained for all lead times at
+    once.
+
+    :param lead_times: The lead times in month.
+
+    :type return_persistance: boolean
+    :param return_persistance: Return as the persistance as well.
+
+    :returns: The feature "X" (at observation time), the labels "y" with one
+    column per lead time (NaN beyond the end of the data), the target season
+    "timey" of the shortest lead time and if selected the label at
+    observation time "y_persistance".
+    """
+    Xorg, oni = features()
+    lead_first = np.min(lead_times)
+
+    # arange the feature array
+    X = Xorg[:-lead_first-shift,:]
+    X = include_time_lag(X, n_lags=n_lags, step=step)
+
+    # arange the labels
+    yorg = oni.values
+    y = include_lead_labels(yorg, lead_times, offset=n_lags*step + shift)
+
+    # get the time axis of the label of the shortest lead time
+    timey = oni.index[lead_first + n_lags*step + shift:]
+
+    if return_persistance:
+        y_persistance = yorg[n_lags*step: - lead_first - shift]
+        return X, y, timey, y_persistance
+
+    else:
+        return X, y, timey
+
+
 if __name__=="__main__":
     cross_training(DEM, pipeline, 1, lead_times,
                    layers=1, neurons = 32, dropout=0.05, noise_in=0.0, noise_sigma=0.,
@@ -125,6 +173,6 @@ if __name__=="__main__":
                    l2_sigma=0.0, lr=0.01, batch_size=100,
                    epochs=5000, n_segments=5, n_members_segment=3, patience=25,
                    activation='tanh',
-                   verbose=0, pdf="normal", name="gdnn_ex_pca")
+                   verbose=0, pdf="normal", name="gdnn_ex_pca", distill=True)
     
 print("\n \nStep 2 finished, continue to step 3!")
\ No newline at end of file
@@ -8,11 +8,12 @@ sys.path.append(basedir)
 
 import numpy as np
 import pandas as pd
-from os.path import join
+from os.path import join, exists
 
 from ninolearn.utils import month_to_season_first, print_header, include_time_lag, pred_filename
 from ninolearn.pathes import modeldir, infodir, preddir
-from ninolearn.learn.models.dem import DEM
+from ninolearn.learn.inference import numpyEnsemble, export_ensemble, filename
+from ninolearn.learn.distill import teacher_mixture, load_fidelity
 from ninolearn.learn.fit import decades
 
 from s0_start import start_pred_y, start_pred_m
@@ -37,22 +38,64 @@ X = X[-1:,:] # now use only the latest observation to produce forecast
 lead_times = np.load(join(infodir,'lead_times.npy'))
 predictions = np.zeros((2,len(lead_times))) # first row: mean, second row: std
 
+# use the distilled student network of a lead time if it exists (see
+# cross_training(..., distill=True)), otherwise the mixture of the models
+# of all decades
+use_student = True
+
+# maximum RMSE of the student to the teacher on its held-out samples (see
+# student.fit), otherwise the mixture of the models of all decades is used
+student_tol = 0.05
+
+# maximum absolute error of an export with reduced precision weights (as
+# measured at the export), otherwise the ensemble is exported again in float32
+max_precision_error = 0.01
+
 print_header("Making predictions")
 
+def export_float32(dir_name):
+    """
+    Export a trained ensemble in full precision (needs TensorFlow).
+    """
+    from ninolearn.learn.models.dem import DEM
+    dem = DEM()
+    dem.load(location=modeldir, dir_name=dir_name)
+    export_ensemble(dem, join(modeldir, dir_name))
+    return numpyEnsemble.load(modeldir, dir_name)
+
+def load_ensemble(dir_name):
+    """
+    Load the NumPy version of a trained ensemble. Ensembles that were trained
+    before the NumPy export existed or whose reduced precision export is not
+    accurate enough are exported first.
+    """
+    try:
+        ensemble = numpyEnsemble.load(modeldir, dir_name)
+    except FileNotFoundError:
+        return export_float32(dir_name)
+
+    if ensemble.precision_error is not None and \
+       max(ensemble.precision_error.values()) > max_precision_error:
+        print(f"{dir_name}: the reduced precision export is not accurate enough")
+        return export_float32(dir_name)
+    return ensemble
+
 for i in np.arange(len(lead_times)):
     print("Lead time "+str(lead_times[i])+" months")
-    dem = DEM(layers=1, neurons = 32, dropout=0.05, noise_in=0.0, noise_sigma=0.,
-                       noise_mu=0., l1_hidden=0.0, l2_hidden=0.,
-                       l1_mu=0, l2_mu=0., l1_sigma=0,
-                       l2_sigma=0.0, lr=0.01, batch_size=100,
-                       epochs=5000, n_segments=5, n_members_segment=3, patience=25,
-                       activation='tanh',
-                       verbose=0, pdf="normal", name="gdnn_ex_pca")
-    for j in decades[:-1]:
-        dem.load(location=modeldir, dir_name = 'gdnn_ex_pca_decade'+str(j)+'_lead'+str(lead_times[i]))
-    pred = dem.predict(X)
-    predictions[0,i] = pred[0][0] # mean
-    predictions[1,i] = pred[1][0] # std
+    student_name = 'gdnn_ex_pca_student_lead'+str(lead_times[i])
+    fidelity = load_fidelity(modeldir, student_name)
+    accurate = fidelity is not None and \
+               max(fidelity['rmse_mean'], fidelity['rmse_std']) <= student_tol
+    if use_student and exists(join(modeldir, student_name, filename)) and accurate:
+        mean, std = numpyEnsemble.load(modeldir, student_name).predict(X)
+    else:
+        if use_student and exists(join(modeldir, student_name, filename)):
+            print(f"{student_name} is not accurate enough, the mixture of the decades is used")
+        dems = [load_ensemble('gdnn_ex_pca_decade'+str(j)+'_lead'+str(lead_times[i]))
+                for j in decades[:-1]]
+        mean, std = teacher_mixture(dems, X)
+    predictions[0,i] = np.ravel(mean)[0] # mean
+    predictions[1,i] = np.ravel(std)[0] # std
 
 
 # =============================================================================
@@ -3,7 +3,9 @@ STEP 5: FINISH
 Remove the directories and files with (raw and processed) data, trained models,
 and information saved in between.
 Next month you can have a fresh start!
-Note: the folder with the predictions data is NOT removed.
+Note: the folder with the predictions data is NOT removed. Neither is the
+folder with the trials of the hyperparameter search, such that the next
+search can warm-start from them.
 """
 from s0_start import basedir
 import sys  